@@ -0,0 +1,593 @@
+import os
+import sys
+import math
+import json
+import time
+import random
+import argparse
+import statistics
+import tracemalloc
+import tempfile
+import numpy as np
+import pygame
+from game import Game
+from scripts.entities import PhysicsEntity, Enemy
+from scripts.assets import AssetManager
+from scripts.tilemap import TileMap, COLLISION_BACKENDS, CHUNK_SIZE, CHUNK_SHIFT, CHUNK_MASK, CHUNK_RESIDENT, AUTOTILE_BITS
+
+def hold(key, frame=0):
+    # Press a key at a frame and keep it down
+    return [(frame, key, True)]
+
+def tap(key, every, frames, start=0):
+    # Press and release a key every few frames
+    inputs = []
+    for frame in range(start, frames, every):
+        inputs.append((frame, key, True))
+        inputs.append((frame + 1, key, False))
+    return inputs
+
+def spawn_enemies(game, count):
+    # Spread extra enemies over the terrain ahead of the player
+    for i in range(count):
+        x = game.player.pos[0] + random.randint(-100, 600)
+        y = random.randint(-50, 150)
+        game.enemies.add(Enemy(game, (x, y), (8, 15)))
+
+def crowd(count):
+    # Run and dash through a fixed number of enemies
+    return {
+        'frames': 600,
+        'inputs': hold(pygame.K_d) + tap(pygame.K_c, 30, 600) + tap(pygame.K_SPACE, 40, 600),
+        'setup': lambda game: spawn_enemies(game, count),
+    }
+
+def particle_storm(game, frame):
+    # Keep about 10k particles alive around the player, each one lives for 24 frames
+    center = game.player.rect().center
+    for i in range(420):
+        angle = random.random() * math.pi * 2
+        speed = random.random() * 2
+        game.particles.add_particle(center, 'particle', velocity=[math.cos(angle) * speed, math.sin(angle) * speed])
+
+def spark_storm(game, frame):
+    # One enemy death burst of sparks every few frames, the live count has to level off instead of growing
+    if frame % 4 == 0:
+        center = game.player.rect().center
+        for i in range(32):
+            game.sparks.add_spark(center, random.random() * math.pi * 2, 2 + random.random())
+
+def barrage(game, frame):
+    # Ten shots per frame from both sides of the player, about 3600 stay in flight at once
+    x, y = game.player.pos
+    for i in range(10):
+        side = random.choice((-1, 1))
+        game.projectiles.add_projectile((x - side * random.randint(100, 300), y - random.randint(0, 120)), side * 1.5)
+
+# Scripted runs, inputs are (frame, key, pressed), setup runs before the first frame and every_frame before each frame
+SCENARIOS = {
+    'short': {
+        'frames': 600,
+        'inputs': hold(pygame.K_d) + tap(pygame.K_SPACE, 45, 600),
+    },
+    'long': {
+        'frames': 6000,
+        'inputs': hold(pygame.K_d) + tap(pygame.K_SPACE, 45, 6000) + tap(pygame.K_c, 90, 6000, start=20),
+    },
+    'enemies': {
+        'frames': 1200,
+        'inputs': hold(pygame.K_d) + tap(pygame.K_SPACE, 60, 1200),
+        'setup': lambda game: spawn_enemies(game, 200),
+    },
+    'particles': {
+        'frames': 600,
+        'inputs': hold(pygame.K_d) + tap(pygame.K_SPACE, 45, 600),
+        'every_frame': particle_storm,
+    },
+    'sparks': {
+        'frames': 6000,
+        'inputs': hold(pygame.K_d) + tap(pygame.K_SPACE, 45, 6000),
+        'every_frame': spark_storm,
+    },
+    'projectiles': {
+        'frames': 1200,
+        'inputs': hold(pygame.K_d) + tap(pygame.K_SPACE, 45, 1200),
+        'every_frame': barrage,
+    },
+    'crowd_10': crowd(10),
+    'crowd_100': crowd(100),
+    'crowd_1000': crowd(1000),
+}
+
+def make_game(seed, collision='tiles', pipeline=False):
+    # By default chunks are generated on the main thread without a chunk store, so a seeded run always plays out
+    # the same. The pipeline adds the worker thread and a chunk store, cold in a temporary directory like a first run
+    if not pipeline:
+        return Game(seed=seed, headless=True, collision=collision, workers=0, cache_path=None)
+    cache = tempfile.TemporaryDirectory()
+    game = Game(seed=seed, headless=True, collision=collision, workers=1, cache_path=cache.name + '/')
+    # Removed with the game
+    game.benchmark_cache = cache
+    return game
+
+def visible_tiles(game):
+    # Tiles inside the camera rectangle, the blits one frame of terrain took before it was drawn from baked chunks
+    tile_size = game.tilemap.tile_size
+    left, top = int(game.scroll[0]), int(game.scroll[1])
+    width, height = game.display.get_size()
+    get_code = game.tilemap.get_code
+    return sum(1 for x in range(left // tile_size, (left + width) // tile_size + 1)
+               for y in range(top // tile_size, (top + height) // tile_size + 1) if get_code(x, y))
+
+def run_scenario(name, seed, frames=None, collision='tiles', pipeline=False):
+    scenario = SCENARIOS[name]
+    frames = frames or scenario['frames']
+    random.seed(seed)
+    game = make_game(seed, collision, pipeline)
+    # Keep the player alive so every run simulates the same number of frames
+    game.player.health = 10 ** 9
+    if 'setup' in scenario:
+        scenario['setup'](game)
+    game.profiler.enabled = True
+
+    inputs = {}
+    for frame, key, pressed in scenario['inputs']:
+        inputs.setdefault(frame, []).append(pygame.event.Event(pygame.KEYDOWN if pressed else pygame.KEYUP, key=key, mod=0))
+
+    frame_times = []
+    sections = {}
+    chunk_blits = 0
+    tile_blits = 0
+    start = time.perf_counter()
+    for frame in range(frames):
+        for event in inputs.get(frame, []):
+            pygame.event.post(event)
+        if 'every_frame' in scenario:
+            scenario['every_frame'](game, frame)
+        game.step()
+        frame_times.append(game.profiler.frame_time())
+        chunk_blits += game.tilemap.chunks_drawn
+        tile_blits += visible_tiles(game)
+        for section, duration in game.profiler.sections.items():
+            sections[section] = sections.get(section, 0) + duration
+        if not game.running:
+            break
+    elapsed = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(frame_times, n=100)
+    return {
+        'scenario': name,
+        'seed': seed,
+        'collision': collision,
+        'pipeline': pipeline,
+        'frames': len(frame_times),
+        'fps': len(frame_times) / elapsed,
+        'p50_ms': percentiles[49] * 1000,
+        'p95_ms': percentiles[94] * 1000,
+        'p99_ms': percentiles[98] * 1000,
+        'sections_ms': {section: duration / len(frame_times) * 1000 for section, duration in sections.items()},
+        'enemies': len(game.enemies),
+        'sparks': len(game.sparks),
+        'tilemap_bytes': game.tilemap.stream_stats()['bytes'],
+        'chunks_generated': game.tilemap.chunks_generated,
+        'chunks_read': game.tilemap.chunks_read,
+        'chunk_blits': chunk_blits / len(frame_times),
+        'tile_blits': tile_blits / len(frame_times),
+        'distance': game.player.pos[0],
+    }
+
+def physics_step(game, entities):
+    for entity in entities:
+        PhysicsEntity.update(entity, game.tilemap)
+
+def render_step(game, entities):
+    for entity in entities:
+        entity.render(game.display, offset=game.scroll)
+
+# Stages measured by count_allocations, called once per repetition with every entity
+STAGES = {
+    'physics': physics_step,
+    'render': render_step,
+}
+
+def count_allocations(seed, stage, repeats=200, pipeline=False):
+    # Run one stage for the player and 200 enemies around it, counting the Rects and Surface flips it makes and its peak transient memory
+    random.seed(seed)
+    game = make_game(seed, pipeline=pipeline)
+    spawn_enemies(game, 200)
+    for frame in range(60):
+        game.step()
+    entities = [game.player] + list(game.enemies)
+    if stage == 'render':
+        # Line the enemies up on screen, facing both ways
+        for i, enemy in enumerate(entities[1:]):
+            enemy.pos = [game.scroll[0] + i % 20 * 15, game.scroll[1] + i // 20 * 20]
+            enemy.flip = bool(i % 2)
+
+    rects = 0
+    flips = 0
+    original_rect = pygame.Rect
+    original_flip = pygame.transform.flip
+
+    class CountingRect(original_rect):
+        def __init__(self, *args):
+            nonlocal rects
+            rects += 1
+            super().__init__(*args)
+
+    def counting_flip(*args):
+        nonlocal flips
+        flips += 1
+        return original_flip(*args)
+
+    pygame.Rect = CountingRect
+    pygame.transform.flip = counting_flip
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        for i in range(repeats):
+            STAGES[stage](game, entities)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+        pygame.Rect = original_rect
+        pygame.transform.flip = original_flip
+    count = repeats * len(entities)
+    return {'stage': stage, 'calls': count, 'us_per_call': elapsed / count * 1000000, 'rects_per_call': rects / count,
+            'flips_per_call': flips / count, 'peak_bytes': peak}
+
+def sweep_check(seed, speed=60, repeats=2000):
+    # Move an entity 60 px in one update, almost four tiles, at a one tile wall from both sides and down at a one tile
+    # floor, high up in the air, with and without sweeping. The discrete path ends up past the tile, the swept one
+    # has to stop flush against it. Then time ordinary updates of an entity walking on the ground both ways
+    game = make_game(seed)
+    tilemap = game.tilemap
+    tile_size = tilemap.tile_size
+    wall_x, floor_y, top = 20, -50, -62
+    for x in range(0, 4):
+        for y in range(-9, -5):
+            if tilemap.chunk_state(x, y) != CHUNK_RESIDENT:
+                tilemap.load_chunk(x, y)
+    for y in range(top, top + 5):
+        tilemap.set_tile(wall_x, y, 'stone')
+    for x in range(wall_x + 4, wall_x + 8):
+        tilemap.set_tile(x, floor_y, 'stone')
+    size = (8, 15)
+    cases = {
+        'right': ((wall_x * tile_size - size[0] - 20, top * tile_size + 8), (speed, 0), 0, wall_x * tile_size - size[0]),
+        'left': (((wall_x + 1) * tile_size + 20, top * tile_size + 8), (-speed, 0), 0, (wall_x + 1) * tile_size),
+        'down': (((wall_x + 5) * tile_size, floor_y * tile_size - size[1] - 20), (0, speed), 1, floor_y * tile_size - size[1]),
+    }
+    report = {}
+    for swept in (False, True):
+        for name, (pos, movement, axis, flush) in cases.items():
+            entity = PhysicsEntity(game, 'enemy', pos, size)
+            entity.swept = swept
+            entity.update(tilemap, movement)
+            report[('swept ' if swept else 'discrete ') + name] = entity.pos[axis] == flush
+            game.entity_grid.remove(entity)
+
+    player_x = game.player.pos[0]
+    for swept in (False, True):
+        entity = PhysicsEntity(game, 'enemy', (player_x, tilemap.surface_row(int(player_x // tile_size)) * tile_size - size[1]), size)
+        entity.swept = swept
+        start = time.perf_counter()
+        for i in range(repeats):
+            entity.update(tilemap, (1 if i // 100 % 2 else -1, 0))
+        report['swept_us' if swept else 'discrete_us'] = (time.perf_counter() - start) / repeats * 1000000
+        game.entity_grid.remove(entity)
+    return report
+
+def asset_load_times(repeats=5):
+    # Load every atlas with an empty cache directory (cold), then again from the cache it wrote (warm)
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    pygame.init()
+    pygame.display.set_mode((800, 600))
+    cold = []
+    warm = []
+    for i in range(repeats):
+        with tempfile.TemporaryDirectory() as cache_path:
+            for times in (cold, warm):
+                assets = AssetManager(cache_path=cache_path + '/')
+                start = time.perf_counter()
+                assets.load_all()
+                times.append(time.perf_counter() - start)
+    return {'images': len(assets.frames), 'atlases': len(assets.atlases), 'cold_ms': statistics.median(cold) * 1000, 'warm_ms': statistics.median(warm) * 1000}
+
+def startup_times(seed, restarts=10):
+    # Time from creating the game to the end of its first frame, then from every restart to the end of its first frame.
+    # Startup is progressive like in the game: the worker thread generates the starting area outside the spawn chunks
+    # into a cold chunk store, and the restarts page the same seed back in from it
+    start = time.perf_counter()
+    game = make_game(seed, pipeline=True)
+    game.step()
+    first_frame = time.perf_counter() - start
+    queued = len(game.tilemap.pending) + len(game.tilemap.chunks)
+    restart = []
+    for i in range(restarts):
+        start = time.perf_counter()
+        game.reset(seed)
+        game.step()
+        restart.append(time.perf_counter() - start)
+    return {'first_frame_ms': first_frame * 1000, 'restart_ms': statistics.median(restart) * 1000, 'queued': queued}
+
+def query_times(seed, queries=20000, radius=6):
+    # Time solidity queries against every collision backend over the same resident chunks, counting the queries
+    # where a backend disagrees with the tile backend. Chunks are loaded two further out so the rays stay inside
+    pygame.init()
+    rng = random.Random(seed)
+    span = (radius * 2 + 1) * CHUNK_SIZE * 16
+    points = [(rng.random() * span - radius * CHUNK_SIZE * 16, rng.random() * span - radius * CHUNK_SIZE * 16) for i in range(queries)]
+    rects = [pygame.Rect(x, y, 8, 15) for x, y in points]
+    array = np.array(points)
+    reports = []
+    expected = None
+    for collision in COLLISION_BACKENDS:
+        tilemap = TileMap(None, seed=seed, collision=collision)
+        for x in range(-radius - 2, radius + 3):
+            for y in range(-radius - 2, radius + 3):
+                if tilemap.chunk_state(x, y) != CHUNK_RESIDENT:
+                    tilemap.load_chunk(x, y)
+        times = {}
+        start = time.perf_counter()
+        point = [tilemap.solid_check(pos) for pos in points]
+        times['point_us'] = (time.perf_counter() - start) / queries * 1000000
+        start = time.perf_counter()
+        rect = [tilemap.rect_solid(rect) for rect in rects]
+        times['rect_us'] = (time.perf_counter() - start) / queries * 1000000
+        start = time.perf_counter()
+        for pos in points:
+            tilemap.raycast(pos, (pos[0] + 160, pos[1]))
+        times['ray_us'] = (time.perf_counter() - start) / queries * 1000000
+        start = time.perf_counter()
+        around = [tilemap.physics_rects_around(pos) for pos in points]
+        times['around_us'] = (time.perf_counter() - start) / queries * 1000000
+        start = time.perf_counter()
+        many = tilemap.solid_check_many(array)
+        times['many_ms'] = (time.perf_counter() - start) * 1000
+        results = (point, rect, many.tolist(), [tilemap.raycast(pos, (pos[0] + 160, pos[1])) for pos in points], around)
+        if expected is None:
+            expected = results
+        mismatches = sum(a != b for result, expected_result in zip(results, expected) for a, b in zip(result, expected_result))
+        reports.append({'collision': collision, 'queries': queries, 'mismatches': mismatches, **times})
+        tilemap.close()
+    return reports
+
+def generation_rate(seed, columns=200, rows=7, repeats=5):
+    # Chunks generated per second over a block of 200 x 7 chunks, first with an empty height cache so every chunk column
+    # runs its noise once, then again with the column heights cached like chunks regenerated after eviction
+    cold = []
+    warm = []
+    for i in range(repeats):
+        tilemap = TileMap(None, seed=seed)
+        tilemap.height_cache.clear()
+        locs = [(x, y) for x in range(10, 10 + columns) for y in range(-(rows // 2), rows - rows // 2)]
+        for times in (cold, warm):
+            start = time.perf_counter()
+            for x, y in locs:
+                tilemap.generate_chunk(x, y)
+            times.append(time.perf_counter() - start)
+        tilemap.close()
+    return {'chunks': len(locs), 'cold_per_s': len(locs) / statistics.median(cold), 'warm_per_s': len(locs) / statistics.median(warm)}
+
+def brute_force_masks(tilemap, chunk_loc):
+    # Autotile bitmasks of a resident chunk recomputed tile by tile from the resident tiles around it
+    masks = bytearray(CHUNK_SIZE * CHUNK_SIZE)
+    for index in range(CHUNK_SIZE * CHUNK_SIZE):
+        x = chunk_loc[0] * CHUNK_SIZE + (index & CHUNK_MASK)
+        y = chunk_loc[1] * CHUNK_SIZE + (index >> CHUNK_SHIFT)
+        code = tilemap.get_code(x, y)
+        if code:
+            for offset, bit in AUTOTILE_BITS.items():
+                if tilemap.get_code(x + offset[0], y + offset[1]) == code:
+                    masks[index] |= bit
+    return masks
+
+def autotile_check(seed, radius=6, batches=8, batch=64):
+    # Compare the incremental autotile bitmasks with a brute force pass after loading a block of chunks in random order,
+    # after evicting and reloading part of it and after placing tiles along the chunk seams. Only chunks with all four
+    # neighbors resident are compared, the border bits of the others point at terrain that is not loaded.
+    # Then time installing batches of chunks while the resident count grows, the cost per chunk should stay flat
+    rng = random.Random(seed)
+    tilemap = TileMap(None, seed=seed)
+    block = [(x, y) for x in range(-radius, radius + 1) for y in range(-radius, radius + 1)]
+
+    def mismatches():
+        count = 0
+        for chunk_loc in tilemap.chunks:
+            if all((chunk_loc[0] + dx, chunk_loc[1] + dy) in tilemap.chunks for dx, dy in AUTOTILE_BITS):
+                count += sum(a != b for a, b in zip(tilemap.autotile_masks[chunk_loc], brute_force_masks(tilemap, chunk_loc)))
+        return count
+
+    rng.shuffle(block)
+    for chunk_loc in block:
+        tilemap.load_chunk(*chunk_loc)
+    report = {'chunks': len(block), 'loaded': mismatches()}
+    evicted = rng.sample(block, len(block) // 3)
+    for chunk_loc in evicted:
+        tilemap.evict_chunk(chunk_loc)
+    for chunk_loc in evicted:
+        tilemap.load_chunk(*chunk_loc)
+    report['reloaded'] = mismatches()
+    for i in range(200):
+        # Tiles on the first or last row and column of a chunk, next to a seam
+        x = rng.randrange(-radius, radius + 1) * CHUNK_SIZE + rng.choice((0, CHUNK_SIZE - 1))
+        y = rng.randrange(-radius, radius + 1) * CHUNK_SIZE + rng.randrange(CHUNK_SIZE)
+        if rng.random() < 0.5:
+            x, y = y, x
+        tilemap.set_tile(x, y, rng.choice(('grass', 'stone')))
+    report['placed'] = mismatches()
+    tilemap.close()
+
+    # Chunks are generated up front so only installing and autotiling them is timed
+    tilemap = TileMap(None, seed=seed)
+    side = math.isqrt(batches * batch) + 1
+    locs = [(x, y) for y in range(side) for x in range(side)][:batches * batch]
+    generated = [tilemap.generate_chunk(x, y) for x, y in locs]
+    times = []
+    for i in range(0, len(locs), batch):
+        start = time.perf_counter()
+        for chunk_loc, chunk in zip(locs[i:i + batch], generated[i:i + batch]):
+            tilemap.install_chunk(chunk_loc, chunk)
+        times.append((time.perf_counter() - start) / batch * 1000000)
+    tilemap.close()
+    report['first_us'] = times[0]
+    report['last_us'] = times[-1]
+    report['resident'] = len(locs)
+    return report
+
+def render_growth(seed, columns=200, rows=20, repeats=200):
+    # Time the tilemap render of the same view with the starting chunks resident, then again with thousands resident.
+    # The tilemap keeps every chunk, without streaming, so only culling to the camera keeps the time per frame flat
+    game = make_game(seed)
+    game.tilemap.close()
+    tilemap = TileMap(game, seed=seed)
+    width, height = game.display.get_size()
+    offset = (0, tilemap.surface_row(0) * tilemap.tile_size - height // 2)
+
+    def render_ms():
+        # Once first so the chunks in view are baked
+        tilemap.render(game.display, offset=offset, generate=False)
+        start = time.perf_counter()
+        for i in range(repeats):
+            tilemap.render(game.display, offset=offset, generate=False)
+        return (time.perf_counter() - start) / repeats * 1000
+
+    report = {'first_resident': len(tilemap.chunks), 'first_ms': render_ms()}
+    for x in range(-columns // 2, columns // 2):
+        for y in range(-rows // 4, rows - rows // 4):
+            if tilemap.chunk_state(x, y) != CHUNK_RESIDENT:
+                tilemap.load_chunk(x, y)
+    report['last_resident'] = len(tilemap.chunks)
+    report['last_ms'] = render_ms()
+    tilemap.close()
+    return report
+
+def spark_memory(seed, frames=20000, warmup=1000):
+    # Spawn a burst of sparks every few frames and trace the memory held after the warmup and at the end,
+    # finished sparks are compacted out of the pool so both the live count and the memory should level off
+    random.seed(seed)
+    game = make_game(seed)
+    tracemalloc.start()
+    try:
+        for frame in range(frames):
+            spark_storm(game, frame)
+            game.sparks.update()
+            game.sparks.render(game.display, offset=game.scroll)
+            if frame == warmup:
+                warm = tracemalloc.get_traced_memory()[0]
+                warm_sparks = len(game.sparks)
+        end = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return {'frames': frames, 'warm_bytes': warm, 'end_bytes': end, 'warm_sparks': warm_sparks, 'end_sparks': len(game.sparks)}
+
+def print_report(report):
+    print(f"{report['scenario']} ({report['collision']}{', pipeline' if report['pipeline'] else ''}): {report['frames']} frames, {report['fps']:.1f} fps, "
+          f"p50 {report['p50_ms']:.2f} ms, p95 {report['p95_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms, "
+          f"{report['enemies']} enemies, {report['sparks']} sparks, distance {report['distance']:.0f}, "
+          f"tilemap {report['tilemap_bytes'] / 1024:.0f} KB, {report['chunks_generated']} chunks generated, {report['chunks_read']} read, "
+          f"terrain {report['chunk_blits']:.1f} chunk blits/frame for {report['tile_blits']:.1f} tiles")
+    total = sum(report['sections_ms'].values())
+    for section, duration in report['sections_ms'].items():
+        print(f"    {section:<12} {duration:7.3f} ms  {duration / total * 100:5.1f}%")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the game headless with scripted input and report frame times.')
+    parser.add_argument('--scenario', choices=list(SCENARIOS) + ['all'], default='all')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--frames', type=int, help='override the number of frames of the scenario')
+    parser.add_argument('--json', help='also write the reports to this file')
+    parser.add_argument('--allocations', choices=STAGES, help='count the allocations of one entity stage instead')
+    parser.add_argument('--assets', action='store_true', help='time cold and warm asset loading instead')
+    parser.add_argument('--startup', action='store_true', help='time the first frame and restarts with the worker thread and a chunk store, like the game, instead')
+    parser.add_argument('--collision', choices=COLLISION_BACKENDS, default='tiles', help='collision backend of the scenarios')
+    parser.add_argument('--pipeline', action='store_true', help='generate chunks on the worker thread with a cold chunk store, like the game, '
+                        'instead of on the main thread without a store; runs are not reproducible then')
+    parser.add_argument('--generation', action='store_true', help='time chunk generation in chunks per second instead')
+    parser.add_argument('--queries', action='store_true', help='time solidity queries of every collision backend instead')
+    parser.add_argument('--autotile', action='store_true', help='check incremental autotiling against a brute force pass and time it instead')
+    parser.add_argument('--render-growth', action='store_true', help='check that tilemap render time stays flat with thousands of chunks resident instead')
+    parser.add_argument('--sweep', action='store_true', help='check that swept collision stops fast moves that pass through tiles and time it instead')
+    parser.add_argument('--spark-memory', action='store_true', help='check that spark memory levels off under constant bursts instead')
+    args = parser.parse_args()
+
+    # The checks exit with status 1 when they fail, costs may vary with the machine so they get twice their baseline
+    if args.autotile:
+        report = autotile_check(args.seed)
+        ok = report['loaded'] == report['reloaded'] == report['placed'] == 0 and report['last_us'] < report['first_us'] * 2
+        print(f"autotile: {report['chunks']} chunks, mismatches loaded {report['loaded']}, reloaded {report['reloaded']}, placed {report['placed']}; "
+              f"install {report['first_us']:.1f} us/chunk at first, {report['last_us']:.1f} us/chunk with {report['resident']} resident: {'ok' if ok else 'FAILED'}")
+        pygame.quit()
+        sys.exit(0 if ok else 1)
+
+    if args.render_growth:
+        report = render_growth(args.seed)
+        ok = report['last_ms'] < report['first_ms'] * 2
+        print(f"render growth: {report['first_ms']:.3f} ms/frame with {report['first_resident']} chunks resident, "
+              f"{report['last_ms']:.3f} ms/frame with {report['last_resident']}: {'ok' if ok else 'FAILED'}")
+        pygame.quit()
+        sys.exit(0 if ok else 1)
+
+    if args.sweep:
+        report = sweep_check(args.seed)
+        ok = all(stopped for name, stopped in report.items() if name.startswith('swept '))
+        stops = ', '.join(f"{name} {'stops' if report[name] else 'passes'}" for name in report if not name.endswith('_us'))
+        print(f"sweep: {stops}; update {report['discrete_us']:.2f} us discrete, {report['swept_us']:.2f} us swept: {'ok' if ok else 'FAILED'}")
+        pygame.quit()
+        sys.exit(0 if ok else 1)
+
+    if args.spark_memory:
+        report = spark_memory(args.seed)
+        ok = report['end_bytes'] < report['warm_bytes'] * 2 and report['end_sparks'] < report['warm_sparks'] * 2
+        print(f"spark memory: {report['warm_bytes'] / 1024:.0f} KB and {report['warm_sparks']} sparks after warmup, "
+              f"{report['end_bytes'] / 1024:.0f} KB and {report['end_sparks']} sparks after {report['frames']} frames: {'ok' if ok else 'FAILED'}")
+        pygame.quit()
+        sys.exit(0 if ok else 1)
+
+    if args.generation:
+        report = generation_rate(args.seed)
+        print(f"generation: {report['chunks']} chunks, {report['cold_per_s']:.0f} chunks/s with an empty height cache, "
+              f"{report['warm_per_s']:.0f} chunks/s with the column heights cached")
+        pygame.quit()
+        sys.exit()
+
+    if args.queries:
+        for report in query_times(args.seed):
+            print(f"{report['collision']}: {report['queries']} queries, point {report['point_us']:.2f} us, rect {report['rect_us']:.2f} us, "
+                  f"ray {report['ray_us']:.2f} us, rects around {report['around_us']:.2f} us, batch {report['many_ms']:.2f} ms, {report['mismatches']} mismatches")
+        pygame.quit()
+        sys.exit()
+
+    if args.startup:
+        report = startup_times(args.seed)
+        print(f"startup: first frame after {report['first_frame_ms']:.2f} ms with {report['queued']} chunks resident or queued, "
+              f"restart to first frame {report['restart_ms']:.2f} ms")
+        pygame.quit()
+        sys.exit()
+
+    if args.assets:
+        report = asset_load_times()
+        print(f"assets: {report['images']} images in {report['atlases']} atlases, cold {report['cold_ms']:.2f} ms, warm {report['warm_ms']:.2f} ms")
+        pygame.quit()
+        sys.exit()
+
+    if args.allocations:
+        report = count_allocations(args.seed, args.allocations, pipeline=args.pipeline)
+        print(f"{report['stage']}: {report['calls']} calls, {report['us_per_call']:.2f} us/call, {report['rects_per_call']:.2f} rects/call, "
+              f"{report['flips_per_call']:.2f} flips/call, peak transient {report['peak_bytes']} bytes")
+        pygame.quit()
+        sys.exit()
+
+    reports = []
+    for name in SCENARIOS if args.scenario == 'all' else [args.scenario]:
+        reports.append(run_scenario(name, args.seed, args.frames, args.collision, args.pipeline))
+        print_report(reports[-1])
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+    pygame.quit()
+    sys.exit()
@@ -1,22 +1,38 @@
+import os
 import sys
+import argparse
 import pygame
 import random
-import math
 from scripts.entities import PhysicsEntity, Player, Enemy
-from scripts.utility import LoadImage, LoadImages, Animations
-from scripts.tilemap import TileMap
+from scripts.utility import LoadImage, LoadImages, Animations, BASE_CACHE_PATH
+from scripts.tilemap import TileMap, CHUNK_SIZE
+from scripts.chunkstore import ChunkStore, prune_stores
 from scripts.clouds import Clouds
-from scripts.particles import ParticleSystem, Particle
-from scripts.spark import Spark
+from scripts.particles import ParticleSystem
+from scripts.spark import SparkSystem
+from scripts.projectiles import ProjectileSystem
+from scripts.enemy_manager import EnemyManager
+from scripts.profiler import Profiler
+from scripts.hud import HUD
+from scripts.spatial import SpatialHash
+
+# Length of a simulation tick in seconds, the game is simulated at this fixed rate whatever the frame rate
+TICK = 1 / 60
+# Most ticks simulated before a frame is drawn, a slower machine drops the rest instead of falling further behind
+MAX_TICKS_PER_FRAME = 5
+# Frame rate cap of the game window
+RENDER_FPS = 60
 
 class Game:
-    def __init__(self):
+    def __init__(self, seed=None, headless=False, collision='tiles', workers=1, cache_path=BASE_CACHE_PATH):
+        if headless:
+            # Render off-screen so the game can run without a window, e.g. for benchmarks
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
         pygame.init()
         pygame.display.set_caption("Infinite Noise Game")
         self.screen = pygame.display.set_mode((800, 600))
         self.display = pygame.Surface((320, 240))
         self.clock = pygame.time.Clock()
-        self.movement = [False, False]
         self.assets = {
             'decor': LoadImages('tiles/decor'),
             'grass': LoadImages('tiles/grass'),
@@ -36,20 +52,55 @@ class Game:
             'gun': LoadImage('gun.png'),
             'projectile': LoadImage('projectile.png')
         }
+        self.assets['gun/flipped'] = pygame.transform.flip(self.assets['gun'], True, False)
+        self.font = pygame.font.Font(None, 36)
+        self.hud = HUD(self.font)
+        self.profiler = Profiler()
+        self.show_profiler = False
+        # Ticks simulated for the frame being drawn
+        self.frame_ticks = 0
+        # Collision backend of the tilemap, 'tiles' or 'heightfield'
+        self.collision = collision
+        # Background chunk generation threads, 0 generates every chunk on the main thread so a seeded run is
+        # reproducible, and the directory of the chunk stores, None to keep no store
+        self.workers = workers
+        self.cache_path = cache_path
+        # Seed asked for on start, restarts replay it, None picks a new random world every time
+        self.seed = seed
+        self.tilemap = None
+        self.reset(seed)
 
+    def reset(self, seed=None):
+        # Start a new run, everything loaded once in __init__ is kept
+        if self.tilemap is not None:
+            self.tilemap.close()
+        self.movement = [False, False]
         self.clouds = Clouds(self.assets['clouds'], count=16)
+        # Broadphase index of the player and the enemies, kept up to date as they move
+        self.entity_grid = SpatialHash(cell_size=32)
         self.player = Player(self, (50, 50), (8, 15))
-        seed = random.randint(0, 1000000)
+        # Worlds asked for by seed keep their own store so they start instantly next time. A random world is unlikely
+        # to be visited again, it gets the session store, started over by the next random world, so evicted chunks
+        # are still paged back in instead of regenerated
+        store = None
+        if seed is None:
+            seed = random.randint(0, 1000000)
+            store_name = 'chunks_session.bin'
+        else:
+            store_name = f'chunks_{seed}.bin'
+        if self.cache_path is not None:
+            store = ChunkStore(self.cache_path + store_name, seed, CHUNK_SIZE * CHUNK_SIZE)
+            prune_stores(self.cache_path)
         print(f"Seed: {seed}")  # Print the seed for reference
-        self.tilemap = TileMap(self, tile_size=16, seed=seed)
+        self.tilemap = TileMap(self, tile_size=16, seed=seed, stream_radius=6, max_chunks=160, workers=self.workers, store=store, collision=self.collision)
         self.scroll = [0, 0]
-        self.enemies = []
+        self.prev_scroll = [0, 0]
+        self.enemies = EnemyManager(self)
         self.particles = ParticleSystem(self, 'particle')
-        self.projectiles = []  # Initialize the projectiles list
-        self.sparks = []
+        self.projectiles = ProjectileSystem(self)
+        self.sparks = SparkSystem()
         
         self.score = 0
-        self.font = pygame.font.Font(None, 36)
         self.next_enemy_spawn_score = 20  # Score threshold for next enemy spawn
         self.last_player_x = self.player.pos[0]
         self.distance_score = 0
@@ -58,13 +109,14 @@ class Game:
         self.generate_initial_enemies()
         self.confirm_quit = False
         self.game_over = False
+        self.running = True
 
     def generate_initial_enemies(self):
         # Generate initial enemies at random positions
         for i in range(5):  # Adjust number of enemies as needed
             x = random.randint(50, 500)
             y = random.randint(50, 300)
-            self.enemies.append(Enemy(self, (x, y), (8, 15)))
+            self.enemies.add(Enemy(self, (x, y), (8, 15)))
 
     def generate_enemies(self):
         # Generate a random number of enemies (2-6) to the right of the player
@@ -72,7 +124,19 @@ class Game:
         for _ in range(num_enemies):
             x = self.player.pos[0] + random.randint(200, 400)
             y = random.randint(50, 300)
-            self.enemies.append(Enemy(self, (x, y), (8, 15)))
+            self.enemies.add(Enemy(self, (x, y), (8, 15)))
+
+    def remove_enemy(self, enemy):
+        self.enemies.remove(enemy)
+
+    def damage_player(self):
+        # A projectile hit the player
+        self.player.health -= 1  # Adjust player health handling as needed
+        if self.player.health <= 0:
+            self.player.alive = False  # Handle player death
+            self.game_over = True
+            self.running = False
+        self.particles.add_particle(self.player.rect().center)
 
     def update_score(self):
         # Increment score based on distance traveled
@@ -84,19 +148,16 @@ class Game:
 
     def render_score(self):
         # Render the score on the screen, divided by 20 to make it smaller
-        score_text = self.font.render(f"Score: {int(self.score)}", True, (255, 255, 255))
-        score_rect = score_text.get_rect(center=(self.screen.get_width() // 2, 20))
-        self.screen.blit(score_text, score_rect.topleft)
+        self.hud.blit(self.screen, f"Score: {int(self.score)}", (self.screen.get_width() // 2, 20), anchor='center')
 
     def render_health(self):
         # Render the health on the screen
-        health_text = self.font.render(f"Health: {self.player.health}", True, (255, 255, 255))
-        self.screen.blit(health_text, (10, 10))
+        self.hud.blit(self.screen, f"Health: {self.player.health}", (10, 10))
 
     def game_over_screen(self):
+        # Show the game over message until the player restarts, returns True to restart
         self.screen.fill((0, 0, 0))
-        game_over_text = self.font.render("Sorry, you lost. Press R to restart or Command + Q to exit", True, (255, 0, 0))
-        self.screen.blit(game_over_text, (self.screen.get_width() // 2 - game_over_text.get_width() // 2, self.screen.get_height() // 2))
+        self.hud.blit(self.screen, "Sorry, you lost. Press R to restart or Command + Q to exit", (self.screen.get_width() // 2, self.screen.get_height() // 2), (255, 0, 0), anchor='midtop')
         pygame.display.flip()
         
         while True:
@@ -106,116 +167,188 @@ class Game:
                 sys.exit()
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_r:
-                    self.__init__()  # Restart the game
-                    self.run()
+                    return True
                 elif event.key == pygame.K_q and pygame.key.get_mods() & pygame.KMOD_META:
                     pygame.quit()
                     sys.exit()
 
+    def handle_event(self, event):
+        if event.type == pygame.QUIT:
+            self.running = False
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_a:
+                self.movement[0] = True
+            if event.key == pygame.K_d:
+                self.movement[1] = True
+            if event.key == pygame.K_SPACE:
+                self.player.jump()
+            if event.key == pygame.K_c:
+                self.player.dash()
+            if event.key == pygame.K_ESCAPE:
+                if not self.confirm_quit:
+                    self.confirm_quit = True
+                else:
+                    self.running = False
+            if event.key == pygame.K_q and pygame.key.get_mods() & pygame.KMOD_META:
+                pygame.quit()
+                sys.exit()
+            if event.key == pygame.K_F3:
+                # Toggle the performance overlay, profiling only runs while it is shown
+                self.show_profiler = not self.show_profiler
+                self.profiler.enabled = self.show_profiler
+            if event.key == pygame.K_F4:
+                self.profiler.export('profile_trace.json')
+                self.profiler.export('profile_trace.csv')
+        if event.type == pygame.KEYUP:
+            if event.key == pygame.K_a:
+                self.movement[0] = False
+            if event.key == pygame.K_d:
+                self.movement[1] = False
+
+    def simulate(self):
+        # Advance the game by one fixed tick of TICK seconds
+        self.clouds.update()
+        self.profiler.lap('clouds')
+        self.prev_scroll[0] = self.scroll[0]
+        self.prev_scroll[1] = self.scroll[1]
+        self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 15
+        self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 15
+        movement = [0, 0]
+
+        if self.movement[0]:
+            movement[0] = -2
+        if self.movement[1]:
+            movement[0] = 2
+
+        camera_center = (int(self.scroll[0]) + self.display.get_width() // 2, int(self.scroll[1]) + self.display.get_height() // 2)
+        self.tilemap.generate_around_player(camera_center)
+        self.profiler.lap('generation')
+        self.player.update(self.tilemap, movement)
+        self.profiler.lap('player')
+
+        self.enemies.update(self.tilemap, camera_center)
+        if abs(self.player.dashing) >= 50:
+            for enemy in self.entity_grid.query_point(self.player.rect().center):
+                if enemy is not self.player:
+                    enemy.dash_hit()
+        self.profiler.lap('enemies')
+
+        self.projectiles.update()
+        self.projectiles.collide()
+        self.profiler.lap('projectiles')
+
+        self.sparks.update()
+        self.profiler.lap('sparks')
+
+        self.particles.update()
+        self.profiler.lap('particles')
+
+        for event in pygame.event.get():
+            self.handle_event(event)
+
+        self.update_score()  # Update the score based on distance traveled
+        if self.score >= self.next_enemy_spawn_score:
+            self.generate_enemies()
+            self.next_enemy_spawn_score += 20  # Set the next threshold
+        self.profiler.lap('logic')
+
+    def draw(self, alpha=1):
+        # Draw the game alpha of the way from the previous tick to the last one, so motion stays smooth
+        # when frames and ticks don't line up
+        render_scroll = (int(self.scroll[0] - (self.scroll[0] - self.prev_scroll[0]) * (1 - alpha)),
+                         int(self.scroll[1] - (self.scroll[1] - self.prev_scroll[1]) * (1 - alpha)))
+        self.display.blit(self.assets['background'], (0, 0))
+        self.clouds.render(self.display, offset=render_scroll)
+        self.profiler.lap('clouds')
+        self.tilemap.render(self.display, offset=render_scroll, generate=False)
+        self.profiler.lap('tilemap')
+        self.player.render(self.display, offset=render_scroll if alpha == 1 else self.player.lerp_offset(render_scroll, alpha))
+        self.profiler.lap('player')
+        self.enemies.render(self.display, offset=render_scroll, alpha=alpha)
+        self.profiler.lap('enemies')
+        self.projectiles.render(self.display, offset=render_scroll, alpha=alpha)
+        self.profiler.lap('projectiles')
+        self.sparks.render(self.display, offset=render_scroll)
+        self.profiler.lap('sparks')
+        self.particles.render(self.display, offset=render_scroll)
+        self.profiler.lap('particles')
+
+        self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
+        self.profiler.lap('scale')
+        self.render_score()  # Render the score on the screen
+        self.render_health()  # Render the health on the screen
+
+        # Display exit instruction
+        self.hud.blit(self.screen, "Press ESC to exit", (10, self.screen.get_height() - 30))
+
+        # Handle quit confirmation
+        if self.confirm_quit:
+            self.hud.blit(self.screen, "Are you sure you want to quit? Press Cmd+Q for yes, any other key for no.", (self.screen.get_width() // 2, self.screen.get_height() // 2), (255, 0, 0), anchor='midtop')
+            pygame.display.flip()
+            event = pygame.event.wait()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    self.running = False
+                else:
+                    self.confirm_quit = False
+        self.profiler.lap('hud')
+
+        if self.profiler.enabled:
+            self.profiler.count('ticks', self.frame_ticks)
+            self.profiler.count('enemies', len(self.enemies))
+            self.profiler.count('enemies_asleep', self.enemies.asleep)
+            self.profiler.count('enemies_drawn', self.enemies.drawn)
+            self.profiler.count('texts_rendered', self.hud.rendered)
+            self.profiler.count('projectiles', len(self.projectiles))
+            self.profiler.count('particles', len(self.particles))
+            self.profiler.count('sparks', len(self.sparks))
+            self.profiler.count('chunks_drawn', self.tilemap.chunks_drawn)
+            self.profiler.count('chunks_generated', self.tilemap.frame_generations)
+            self.profiler.count('chunks_read', self.tilemap.frame_reads)
+            self.profiler.count('chunks_resident', len(self.tilemap.chunks))
+            self.profiler.count('tilemap_kb', self.tilemap.stream_stats()['bytes'] // 1024)
+            if self.show_profiler:
+                self.profiler.render(self.screen)
+            self.profiler.lap('overlay')
+
+        pygame.display.update()
+        self.profiler.lap('present')
+
+    def step(self):
+        # Simulate and draw a single tick, headless runs call this as fast as they can
+        self.profiler.start_frame()
+        self.simulate()
+        self.frame_ticks = 1
+        self.draw()
+        self.profiler.end_frame()
+
     def run(self):
-        running = True
-
-        while running:
-            self.display.blit(self.assets['background'], (0, 0))
-            self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 15
-            self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 15
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
-            self.clouds.update()
-            self.clouds.render(self.display, offset=render_scroll)
-            movement = [0, 0]
-
-            if self.movement[0]:
-                movement[0] = -2
-            if self.movement[1]:
-                movement[0] = 2
-
-            self.tilemap.render(self.display, offset=render_scroll)
-            self.player.update(self.tilemap, movement)
-            self.player.render(self.display, offset=render_scroll)
-
-            for enemy in self.enemies:
-                enemy.update(self.tilemap)
-                enemy.render(self.display, offset=render_scroll)
-
-            for projectile in self.projectiles.copy():
-                projectile[0][0] += projectile[1]
-                projectile[2] += 1
-                img = self.assets['projectile']
-                self.display.blit(img, (projectile[0][0] - img.get_width() / 2 - render_scroll[0], projectile[0][1] - img.get_height() / 2 - render_scroll[1]))
-                if self.tilemap.solid_check(projectile[0]):
-                    self.projectiles.remove(projectile)
-                    for i in range(4):
-                        self.sparks.append(Spark(projectile[0], random.random() - 0.5 + (math.pi if projectile[1] > 0 else 0), 2 + random.random()))
-                elif projectile[2] > 360:
-                    self.projectiles.remove(projectile)
-                elif abs(self.player.dashing) < 50:
-                    if self.player.rect().collidepoint(projectile[0]):
-                        self.projectiles.remove(projectile)
-                        self.player.health -= 1  # Adjust player health handling as needed
-                        if self.player.health <= 0:
-                            self.player.alive = False  # Handle player death
-                            self.game_over = True
-                            running = False
-                        self.particles.add_particle(self.player.rect().center)
-
-            self.particles.update()
-            self.particles.render(self.display, offset=render_scroll)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_a:
-                        self.movement[0] = True
-                    if event.key == pygame.K_d:
-                        self.movement[1] = True
-                    if event.key == pygame.K_SPACE:
-                        self.player.jump()
-                    if event.key == pygame.K_c:
-                        self.player.dash()
-                    if event.key == pygame.K_ESCAPE:
-                        if not self.confirm_quit:
-                            self.confirm_quit = True
-                        else:
-                            running = False
-                    if event.key == pygame.K_q and pygame.key.get_mods() & pygame.KMOD_META:
-                        pygame.quit()
-                        sys.exit()
-                if event.type == pygame.KEYUP:
-                    if event.key == pygame.K_a:
-                        self.movement[0] = False
-                    if event.key == pygame.K_d:
-                        self.movement[1] = False
-
-            self.update_score()  # Update the score based on distance traveled
-            if self.score >= self.next_enemy_spawn_score:
-                self.generate_enemies()
-                self.next_enemy_spawn_score += 20  # Set the next threshold
-
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            self.render_score()  # Render the score on the screen
-            self.render_health()  # Render the health on the screen
-
-            # Display exit instruction
-            exit_text = self.font.render("Press ESC to exit", True, (255, 255, 255))
-            self.screen.blit(exit_text, (10, self.screen.get_height() - 30))
-
-            # Handle quit confirmation
-            if self.confirm_quit:
-                confirm_text = self.font.render("Are you sure you want to quit? Press Cmd+Q for yes, any other key for no.", True, (255, 0, 0))
-                self.screen.blit(confirm_text, (self.screen.get_width() // 2 - confirm_text.get_width() // 2, self.screen.get_height() // 2))
-                pygame.display.flip()
-                event = pygame.event.wait()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        running = False
-                    else:
-                        self.confirm_quit = False
-
-            pygame.display.update()
-            self.clock.tick(60)
-
-        if self.game_over:
-            self.game_over_screen()
-
-Game().run()
+        while True:
+            self.running = True
+            # Simulated time owed to the game, paid in fixed ticks, what is left over sets the interpolation of the frame
+            accumulator = 0
+            self.clock.tick()
+            while self.running:
+                accumulator += self.clock.tick(RENDER_FPS) / 1000
+                self.profiler.start_frame()
+                self.frame_ticks = 0
+                while accumulator >= TICK and self.running:
+                    if self.frame_ticks == MAX_TICKS_PER_FRAME:
+                        # Too far behind to catch up, drop the backlog and let the game run slower for a moment
+                        accumulator = 0
+                        break
+                    self.simulate()
+                    accumulator -= TICK
+                    self.frame_ticks += 1
+                self.draw(accumulator / TICK)
+                self.profiler.end_frame()
+
+            if not self.game_over or not self.game_over_screen():
+                break
+            self.reset(self.seed)  # Restart the game
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ninja Noise, an infinite platformer on noise generated terrain.')
+    parser.add_argument('--seed', type=int, help='world to play, every restart replays it and its chunks are kept on disk between sessions')
+    args = parser.parse_args()
+    Game(seed=args.seed).run()
@@ -0,0 +1,179 @@
+import os
+import json
+import struct
+import zlib
+import pygame
+
+# Data directory next to the scripts package, so the game runs from any working directory
+BASE_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data') + '/'
+BASE_IMAGE_PATH = BASE_DATA_PATH + 'images/'
+BASE_CACHE_PATH = BASE_DATA_PATH + 'cache/'
+
+# Images packed together, by atlas name, every entry is a directory or a file under BASE_IMAGE_PATH
+ATLASES = {
+    'tiles': ('tiles',),
+    'entities': ('entities',),
+    'particles': ('particles',),
+    'clouds': ('clouds',),
+    'misc': ('background.png', 'gun.png', 'projectile.png'),
+}
+# Width of the atlases, wider images get an atlas as wide as themselves
+ATLAS_WIDTH = 512
+
+# Cache file header: magic, format version, atlas size, length of the JSON layout that follows and the crc32 of
+# everything after the header, the layout lists the source files with their mtime and size and the rect of every image,
+# then come the RGB pixels
+MAGIC = b'NNAT'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sHIIII')
+
+class AssetManager:
+    def __init__(self, image_path=BASE_IMAGE_PATH, cache_path=BASE_CACHE_PATH, atlases=ATLASES):
+        self.image_path = image_path
+        self.cache_path = cache_path
+        self.atlas_paths = atlases
+        # Every loaded image by path, images in an atlas are subsurfaces sharing its pixels
+        self.frames = {}
+        self.atlases = {}
+        # Load counters, images decoded from PNG and atlases read back from the cache
+        self.decoded = 0
+        self.cache_hits = 0
+
+    def atlas_for(self, path):
+        # Name of the atlas an image or directory belongs to, None if it is not packed
+        for name, paths in self.atlas_paths.items():
+            for atlas_path in paths:
+                if path == atlas_path or path.startswith(atlas_path + '/'):
+                    return name
+        return None
+
+    def image(self, path):
+        # Load an image once, every later call returns the same surface
+        surface = self.frames.get(path)
+        if surface is None:
+            name = self.atlas_for(path)
+            if name is not None and name not in self.atlases:
+                self.load_atlas(name)
+            if path not in self.frames:
+                self.frames[path] = self.decode(path)
+            surface = self.frames[path]
+        return surface
+
+    def images(self, path):
+        # Load the images of a directory sorted by file name, shared like image()
+        name = self.atlas_for(path)
+        if name is not None:
+            if name not in self.atlases:
+                self.load_atlas(name)
+            prefix = path + '/'
+            return [self.frames[frame] for frame in sorted(self.frames) if frame.startswith(prefix) and '/' not in frame[len(prefix):]]
+        return [self.image(path + '/' + image_name) for image_name in sorted(os.listdir(self.image_path + path))]
+
+    def load_all(self):
+        for name in self.atlas_paths:
+            if name not in self.atlases:
+                self.load_atlas(name)
+
+    def decode(self, path):
+        image = pygame.image.load(self.image_path + path).convert()
+        image.set_colorkey((0, 0, 0))
+        self.decoded += 1
+        return image
+
+    def sources(self, name):
+        # Every PNG of an atlas with its mtime and size, sorted by path
+        sources = []
+        pending = list(self.atlas_paths[name])
+        while pending:
+            path = pending.pop()
+            if not os.path.isdir(self.image_path + path):
+                stat = os.stat(self.image_path + path)
+                sources.append([path, stat.st_mtime_ns, stat.st_size])
+                continue
+            with os.scandir(self.image_path + path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        pending.append(path + '/' + entry.name)
+                    elif entry.name.endswith('.png'):
+                        stat = entry.stat()
+                        sources.append([path + '/' + entry.name, stat.st_mtime_ns, stat.st_size])
+        return sorted(sources)
+
+    def load_atlas(self, name):
+        # Read an atlas from the cache, or decode and pack its images and write the cache
+        sources = self.sources(name)
+        cache_file = self.cache_path + 'atlas_' + name + '.bin'
+        loaded = self.read_cache(cache_file, sources)
+        if loaded is None:
+            loaded = self.pack([path for path, mtime, size in sources])
+            self.write_cache(cache_file, sources, *loaded)
+        else:
+            self.cache_hits += 1
+        atlas, rects = loaded
+        atlas = atlas.convert()
+        self.atlases[name] = atlas
+        for path, rect in rects.items():
+            frame = atlas.subsurface(rect)
+            frame.set_colorkey((0, 0, 0))
+            self.frames[path] = frame
+
+    def pack(self, paths):
+        # Shelf packing, tallest images first, rows of up to ATLAS_WIDTH pixels
+        images = {}
+        for path in paths:
+            images[path] = pygame.image.load(self.image_path + path).convert()
+            self.decoded += 1
+        width = max([ATLAS_WIDTH] + [image.get_width() for image in images.values()])
+        rects = {}
+        x = y = row_height = 0
+        for path in sorted(paths, key=lambda path: (-images[path].get_height(), path)):
+            image_width, image_height = images[path].get_size()
+            if x + image_width > width:
+                x = 0
+                y += row_height
+                row_height = 0
+            rects[path] = (x, y, image_width, image_height)
+            x += image_width
+            row_height = max(row_height, image_height)
+        atlas = pygame.Surface((width, max(1, y + row_height)))
+        for path, rect in rects.items():
+            atlas.blit(images[path], rect[:2])
+        return atlas, rects
+
+    def read_cache(self, cache_file, sources):
+        # Cached atlas and image rects, None if the cache is missing, damaged or older than a source
+        try:
+            with open(cache_file, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < HEADER.size:
+            return None
+        magic, version, width, height, layout_size, crc = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION or len(data) != HEADER.size + layout_size + width * height * 3:
+            return None
+        if zlib.crc32(memoryview(data)[HEADER.size:]) != crc:
+            return None
+        try:
+            layout = json.loads(data[HEADER.size:HEADER.size + layout_size])
+            if layout['sources'] != sources:
+                return None
+            rects = {path: tuple(rect) for path, rect in layout['rects'].items()}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+        atlas = pygame.image.frombytes(data[HEADER.size + layout_size:], (width, height), 'RGB')
+        return atlas, rects
+
+    def write_cache(self, cache_file, sources, atlas, rects):
+        layout = json.dumps({'sources': sources, 'rects': rects}).encode()
+        os.makedirs(self.cache_path, exist_ok=True)
+        # Write next to the cache file and swap it in, so a crash never leaves a half written cache
+        pixels = pygame.image.tobytes(atlas, 'RGB')
+        with open(cache_file + '.tmp', 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, atlas.get_width(), atlas.get_height(), len(layout), zlib.crc32(pixels, zlib.crc32(layout))))
+            f.write(layout)
+            f.write(pixels)
+        os.replace(cache_file + '.tmp', cache_file)
+
+# Assets shared by the whole game, LoadImage and LoadImages go through it
+ASSETS = AssetManager()
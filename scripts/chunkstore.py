@@ -0,0 +1,101 @@
+import os
+import mmap
+import struct
+import zlib
+
+# File header: magic, format version, bytes per chunk and the seed the chunks were generated with
+MAGIC = b'NNCK'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHq')
+# Every record is a chunk coordinate and the crc32 of its tile codes, followed by the tile codes
+RECORD = struct.Struct('<iiI')
+# Most chunks kept in a store, chunks visited after that are regenerated every time
+MAX_STORED_CHUNKS = 4096
+# Most chunk stores kept in a directory, the least recently used ones are deleted
+MAX_STORES = 4
+
+def prune_stores(directory, keep=MAX_STORES):
+    # Delete the least recently used chunks_*.bin stores of a directory beyond the newest keep
+    try:
+        with os.scandir(directory) as entries:
+            stores = [(entry.stat().st_mtime, entry.path) for entry in entries if entry.name.startswith('chunks_') and entry.name.endswith('.bin')]
+    except OSError:
+        return
+    for mtime, path in sorted(stores, reverse=True)[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class ChunkStore:
+    def __init__(self, path, seed, chunk_bytes, max_chunks=MAX_STORED_CHUNKS):
+        self.path = path
+        self.seed = seed
+        self.chunk_bytes = chunk_bytes
+        self.max_chunks = max_chunks
+        self.record_size = RECORD.size + chunk_bytes
+        # Offset of the record of every stored chunk
+        self.index = {}
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'a+b')
+        self.file.seek(0)
+        header = self.file.read(HEADER.size)
+        if len(header) != HEADER.size or HEADER.unpack(header) != (MAGIC, FORMAT_VERSION, chunk_bytes, seed):
+            # Missing, outdated or foreign file, start over
+            self.file.truncate(0)
+            self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, chunk_bytes, seed))
+            self.file.flush()
+        # Mark the store as recently used for prune_stores
+        os.utime(path)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.scan()
+
+    def scan(self):
+        # Index the records in the file, cutting it at the first truncated or corrupted record
+        offset = HEADER.size
+        while offset + self.record_size <= len(self.map) and len(self.index) < self.max_chunks:
+            x, y, crc = RECORD.unpack_from(self.map, offset)
+            if zlib.crc32(self.map[offset + RECORD.size:offset + self.record_size]) != crc:
+                break
+            self.index[(x, y)] = offset
+            offset += self.record_size
+        if offset != len(self.map):
+            self.map.close()
+            self.file.truncate(offset)
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, chunk_loc):
+        return chunk_loc in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, x, y):
+        # Get a copy of the stored tile codes of a chunk, None if it is missing or fails its check
+        offset = self.index.get((x, y))
+        if offset is None:
+            return None
+        if offset + self.record_size > len(self.map):
+            # Written after the file was last mapped
+            self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        crc = RECORD.unpack_from(self.map, offset)[2]
+        chunk = bytearray(self.map[offset + RECORD.size:offset + self.record_size])
+        if zlib.crc32(chunk) != crc:
+            del self.index[(x, y)]
+            return None
+        return chunk
+
+    def put(self, x, y, chunk):
+        # Append the tile codes of a chunk, chunks are generated deterministically so they are never rewritten
+        if (x, y) in self.index or len(self.index) == self.max_chunks:
+            return
+        self.file.seek(0, os.SEEK_END)
+        self.index[(x, y)] = self.file.tell()
+        self.file.write(RECORD.pack(x, y, zlib.crc32(chunk)) + bytes(chunk))
+        self.file.flush()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
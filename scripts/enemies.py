@@ -1,6 +1,5 @@
 import pygame
 import random
-from .utility import LoadImages, Animations
 from .entities import PhysicsEntity
 
 class Enemy(PhysicsEntity):
@@ -10,9 +9,10 @@ class Enemy(PhysicsEntity):
         self.flip = False
         self.action = 'run'
         self.frame = 0
+        # Shared animations from the asset table, copies only carry the frame counter
         self.animation_database = {
-            'idle': Animations(LoadImages('entities/enemy/idle'), img_dur=6),
-            'run': Animations(LoadImages('entities/enemy/run'), img_dur=4),
+            'idle': self.game.assets['enemy/idle'],
+            'run': self.game.assets['enemy/run'],
             # 'jump': Animations(LoadImages('entities/enemy/jump'), img_dur=6)
         }
         self.animation = self.animation_database['run'].copy()
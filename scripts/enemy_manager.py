@@ -0,0 +1,226 @@
+import random
+import numpy as np
+from scripts.tilemap import CHUNK_SIZE, CHUNK_RESIDENT
+
+# Enemies within this many pixels of the camera centre on both axes are fully simulated
+ACTIVE_RADIUS = 512
+# Enemies further than this are despawned, the ones in between sleep until the camera comes back
+DESPAWN_RADIUS = 1536
+# Extra margin around the surface for render culling, enough for the gun drawn next to an enemy
+RENDER_MARGIN = 16
+# Frames between two shots of an enemy, 2 seconds at 60 FPS
+SHOOT_COOLDOWN = 120
+# Chance per frame that an idle enemy that can't see the player starts walking, and for how many frames
+WALK_CHANCE = 0.01
+WALK_FRAMES = (30, 120)
+# Speed of a walking enemy and of its shots
+WALK_SPEED = 0.5
+PROJECTILE_SPEED = 1.5
+
+class EnemyManager:
+    def __init__(self, game, active_radius=ACTIVE_RADIUS, despawn_radius=DESPAWN_RADIUS):
+        self.game = game
+        self.active_radius = active_radius
+        self.despawn_radius = despawn_radius
+        # Every enemy in spawn order, and the ones simulated during the last update with their slots
+        self.enemies = []
+        self.active = []
+        self.active_slots = []
+        # State of every enemy, entry i belongs to self.enemies[i]: frames left to walk and until the next shot, then
+        # the position, size, facing and whether a wall stopped it, copied from the enemy whenever it is updated
+        self.walking = np.zeros(16, dtype=np.int32)
+        self.shoot_timer = np.zeros(16, dtype=np.int32)
+        self.pos = np.zeros((16, 2))
+        self.size = np.zeros((16, 2), dtype=np.int64)
+        self.flip = np.zeros(16, dtype=bool)
+        self.blocked = np.zeros(16, dtype=bool)
+        # Counters of the last frame
+        self.asleep = 0
+        self.drawn = 0
+        self.despawned = 0
+
+    def __len__(self):
+        return len(self.enemies)
+
+    def __iter__(self):
+        return iter(self.enemies)
+
+    def arrays(self):
+        return (self.walking, self.shoot_timer, self.pos, self.size, self.flip, self.blocked)
+
+    def add(self, enemy):
+        n = len(self.enemies)
+        if n == len(self.walking):
+            self.walking, self.shoot_timer, self.pos, self.size, self.flip, self.blocked = (np.concatenate([array, np.zeros_like(array)]) for array in self.arrays())
+        self.walking[n] = 0
+        self.shoot_timer[n] = 0
+        self.size[n] = enemy.size
+        self.enemies.append(enemy)
+        self.store(n, enemy)
+
+    def store(self, i, enemy):
+        # Copy the state an update may change from an enemy into its slot
+        self.pos[i] = enemy.pos
+        self.flip[i] = enemy.flip
+        self.blocked[i] = enemy.collisions['right'] or enemy.collisions['left']
+
+    def remove(self, enemy):
+        # Shift the state of the later enemies down so it stays in spawn order
+        i = self.enemies.index(enemy)
+        n = len(self.enemies)
+        for array in self.arrays():
+            array[i:n - 1] = array[i + 1:n]
+        del self.enemies[i]
+        if enemy in self.active:
+            j = self.active.index(enemy)
+            del self.active[j]
+            del self.active_slots[j]
+        self.active_slots = [slot - (slot > i) for slot in self.active_slots]
+        self.game.entity_grid.remove(enemy)
+
+    def update(self, tilemap, center):
+        # Simulate the enemies near the camera, leave the mid range asleep and despawn the far ones
+        n = len(self.enemies)
+        distance = np.abs(self.pos[:n] - center).max(axis=1)
+        far = distance > self.despawn_radius
+        self.despawned = int(np.count_nonzero(far))
+        if self.despawned:
+            for i in np.flatnonzero(far).tolist():
+                self.game.entity_grid.remove(self.enemies[i])
+            keep = ~far
+            self.enemies = [enemy for enemy, kept in zip(self.enemies, keep.tolist()) if kept]
+            n = len(self.enemies)
+            for array in self.arrays():
+                array[:n] = array[:len(keep)][keep]
+            distance = distance[keep]
+
+        # Enemies also sleep while the terrain under them is still being generated, so they can't fall through it
+        near = np.flatnonzero(distance <= self.active_radius)
+        chunk_size = tilemap.tile_size * CHUNK_SIZE
+        chunk_x = (self.pos[near, 0] // chunk_size).astype(np.int64).tolist()
+        chunk_top = (self.pos[near, 1] // chunk_size).astype(np.int64).tolist()
+        chunk_below = ((self.pos[near, 1] + self.size[near, 1] + tilemap.tile_size) // chunk_size).astype(np.int64).tolist()
+        slots = [i for i, x, top, below in zip(near.tolist(), chunk_x, chunk_top, chunk_below)
+                 if tilemap.chunk_state(x, top) == CHUNK_RESIDENT and tilemap.chunk_state(x, below) == CHUNK_RESIDENT]
+        active = [self.enemies[i] for i in slots]
+        self.asleep = n - len(active)
+        self.active = active
+        self.active_slots = slots
+        if not active:
+            return
+
+        movement = self.think(tilemap, np.array(slots))
+        for i, enemy, move in zip(slots, active, movement):
+            enemy.update(tilemap, (move, 0))
+            self.store(i, enemy)
+
+    def think(self, tilemap, slots):
+        # Run the decisions of the active enemies at the given slots in one pass and return their horizontal movement.
+        # Random numbers are drawn enemy by enemy in spawn order, so a seeded run plays out like one enemy at a time
+        game = self.game
+        enemies = [self.enemies[i] for i in slots.tolist()]
+        pos = self.pos[slots]
+        flip = self.flip[slots]
+        blocked = self.blocked[slots]
+        size = self.size[slots]
+        # Enemy rects, Rect() truncates the position towards zero
+        left = np.trunc(pos).astype(np.int64)
+        center = left + size // 2
+        shoot_timer = np.maximum(self.shoot_timer[slots] - 1, 0)
+        walking = self.walking[slots]
+        movement = np.zeros(len(enemies))
+
+        # Walking enemies turn around at walls and ledges and otherwise keep going
+        walker = walking > 0
+        turn = np.zeros(len(enemies), dtype=bool)
+        if walker.any():
+            ahead = np.stack([center[walker, 0] + np.where(flip[walker], -7, 7), pos[walker, 1] + 23], axis=1)
+            ground = tilemap.solid_check_many(ahead)
+            turn[walker] = ~ground | blocked[walker]
+            movement[walker] = np.where(turn[walker], 0, np.where(flip[walker], -WALK_SPEED, WALK_SPEED))
+            walking[walker] -= 1
+
+        # The others shoot at the player when it is on their row and in sight, or may start walking
+        player = game.player
+        dis_x = player.pos[0] - pos[:, 0]
+        near = ~walker & (np.abs(player.pos[1] - pos[:, 1]) < 16)
+        seen = np.zeros(len(enemies), dtype=bool)
+        if near.any():
+            seen[near] = self.can_see(tilemap, int(player.pos[0]), left[near, 0], pos[near, 1], flip[near])
+        fire = seen & (shoot_timer == 0)
+        shots = fire & np.where(flip, dis_x < 0, dis_x > 0)
+        shoot_timer[fire] = SHOOT_COOLDOWN
+        idle = ~walker & ~seen
+
+        # Shots and walk starts in spawn order, the shots are queued and added in bulk afterwards
+        spark_pos = []
+        spark_angles = []
+        spark_speeds = []
+        shot_pos = []
+        shot_directions = []
+        rand = random.random
+        for i in np.flatnonzero(shots | idle).tolist():
+            if idle[i]:
+                if rand() < WALK_CHANCE:
+                    walking[i] = random.randint(*WALK_FRAMES)
+                continue
+            if flip[i]:
+                shot = (int(center[i, 0]) - 7, int(center[i, 1]))
+                direction = -PROJECTILE_SPEED
+                base = np.pi
+            else:
+                shot = (int(center[i, 0]) + 7, int(center[i, 1]))
+                direction = PROJECTILE_SPEED
+                base = 0
+            shot_pos.append(shot)
+            shot_directions.append(direction)
+            for j in range(4):
+                spark_pos.append(shot)
+                spark_angles.append(rand() - 0.5 + base)
+                spark_speeds.append(2 + rand())
+        if shot_pos:
+            game.projectiles.add_projectiles(shot_pos, shot_directions)
+            game.sparks.add_sparks(spark_pos, spark_angles, spark_speeds)
+
+        for i in np.flatnonzero(turn).tolist():
+            enemies[i].flip = not enemies[i].flip
+        self.walking[slots] = walking
+        self.shoot_timer[slots] = shoot_timer
+        return movement.tolist()
+
+    def can_see(self, tilemap, player_x, x, y, flip):
+        # Whether every enemy with its rect at x and top edge at y sees the player along its row, in the direction it faces.
+        # Every ray over the same span of tiles sees the same thing, so the results are memoised until a tile changes
+        step = np.where(flip, -1, 1)
+        last = player_x - step
+        visible = (last - x) * step < 0
+        rows = (y // tilemap.tile_size).astype(np.int64)
+        sight_cache = tilemap.sight_cache
+        tile_size = tilemap.tile_size
+        for i in np.flatnonzero(~visible).tolist():
+            start = int(x[i])
+            end = int(last[i])
+            key = (int(rows[i]), start // tile_size, end // tile_size)
+            seen = sight_cache.get(key)
+            if seen is None:
+                seen = sight_cache[key] = tilemap.raycast((start, float(y[i])), (end, float(y[i]))) is None
+            visible[i] = seen
+        return visible
+
+    def render(self, surf, offset=(0, 0), alpha=1):
+        # Draw the active enemies that overlap the surface, alpha of the way from their previous positions
+        left = offset[0] - RENDER_MARGIN
+        top = offset[1] - RENDER_MARGIN
+        right = offset[0] + surf.get_width() + RENDER_MARGIN
+        bottom = offset[1] + surf.get_height() + RENDER_MARGIN
+        self.drawn = 0
+        if not self.active:
+            return
+        slots = np.array(self.active_slots)
+        pos = self.pos[slots]
+        size = self.size[slots]
+        shown = (left < pos[:, 0] + size[:, 0]) & (pos[:, 0] < right) & (top < pos[:, 1] + size[:, 1]) & (pos[:, 1] < bottom)
+        for enemy, visible in zip(self.active, shown.tolist()):
+            if visible:
+                enemy.render(surf, offset=offset if alpha == 1 else enemy.lerp_offset(offset, alpha))
+                self.drawn += 1
@@ -1,14 +1,19 @@
 import math
 import random
 import pygame
-from scripts.particles import Particle
-from scripts.spark import Spark
+from scripts.tilemap import NEIGHBOR_OFFSETS
 
 class PhysicsEntity:
+    # Sweep every move against the tiles in its path before resolving overlaps, so fast moves can't pass through tiles.
+    # Off by default, nothing moves faster than half a tile per tick yet (the player's dash peaks at 8 px)
+    swept = False
+
     def __init__(self, game, e_type, pos, size):
         self.game = game
         self.type = e_type
         self.pos = list(pos)
+        # Position before the last update, frames drawn between two ticks are interpolated from it
+        self.prev_pos = list(pos)
         self.size = size
         self.velocity = [0, 0]
         self.collisions = {'up': False, 'down': False, 'right': False, 'left': False}
@@ -17,6 +22,11 @@ class PhysicsEntity:
         self.flip = False
         self.set_action('idle')
         self.last_movement = [0, 0]
+        # Rects reused by every update, the bounds registered in the broadphase grid and the scratch rects of collision
+        self.bounds = pygame.Rect(self.pos[0], self.pos[1], size[0], size[1])
+        self.collision_rect = pygame.Rect(self.bounds)
+        self.tile_rect = pygame.Rect(0, 0, 0, 0)
+        self.game.entity_grid.update(self, self.bounds)
 
     def rect(self):
         return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
@@ -27,81 +37,103 @@ class PhysicsEntity:
             self.animation = self.game.assets[self.type + '/' + self.action].copy()
 
     def update(self, tilemap, movement=(0, 0)):
-        self.collisions = {'up': False, 'down': False, 'right': False, 'left': False}
-        frame_movement = (movement[0] + self.velocity[0], movement[1] + self.velocity[1])
-        self.pos[0] += frame_movement[0]
-        entity_rect = self.rect()
-        for rect in tilemap.physics_rects_around(self.pos):
-            if entity_rect.colliderect(rect):
-                if frame_movement[0] > 0:
-                    entity_rect.right = rect.left
-                    self.collisions['right'] = True
-                if frame_movement[0] < 0:
-                    entity_rect.left = rect.right
-                    self.collisions['left'] = True
-                self.pos[0] = entity_rect.x
-        self.pos[1] += frame_movement[1]
-        entity_rect = self.rect()
-        for rect in tilemap.physics_rects_around(self.pos):
-            if entity_rect.colliderect(rect):
-                if frame_movement[1] > 0:
-                    entity_rect.bottom = rect.top
-                    self.collisions['down'] = True
-                if frame_movement[1] < 0:
-                    entity_rect.top = rect.bottom
-                    self.collisions['up'] = True
-                self.pos[1] = entity_rect.y
+        self.prev_pos[0] = self.pos[0]
+        self.prev_pos[1] = self.pos[1]
+        collisions = self.collisions
+        collisions['up'] = collisions['down'] = collisions['right'] = collisions['left'] = False
+        self.move(tilemap, 0, movement[0] + self.velocity[0])
+        self.move(tilemap, 1, movement[1] + self.velocity[1])
         if movement[0] > 0:
             self.flip = False
         if movement[0] < 0:
             self.flip = True
         self.last_movement = movement
         self.velocity[1] = min(5, self.velocity[1] + 0.1)
-        if self.collisions['down'] or self.collisions['up']:
+        if collisions['down'] or collisions['up']:
             self.velocity[1] = 0
         self.animation.update()
+        # Rect() truncates the position towards zero, assigning to a rect would round it
+        self.bounds.x = int(self.pos[0])
+        self.bounds.y = int(self.pos[1])
+        self.game.entity_grid.update(self, self.bounds)
+
+    def move(self, tilemap, axis, distance):
+        # Move along one axis and push the entity out of the solid tiles around its new position
+        if self.swept and distance:
+            distance = self.sweep(tilemap, axis, distance)
+        self.pos[axis] += distance
+        rect = self.collision_rect
+        rect.x = int(self.pos[0])
+        rect.y = int(self.pos[1])
+        tile_rect = self.tile_rect
+        tile_size = tilemap.tile_size
+        tile_rect.width = tile_rect.height = tile_size
+        tile_x = int(self.pos[0] // tile_size)
+        tile_y = int(self.pos[1] // tile_size)
+        for offset_x, offset_y in NEIGHBOR_OFFSETS:
+            x = tile_x + offset_x
+            y = tile_y + offset_y
+            if not tilemap.is_solid(x, y):
+                continue
+            tile_rect.x = x * tile_size
+            tile_rect.y = y * tile_size
+            if rect.colliderect(tile_rect):
+                if axis == 0:
+                    if distance > 0:
+                        rect.right = tile_rect.left
+                        self.collisions['right'] = True
+                    if distance < 0:
+                        rect.left = tile_rect.right
+                        self.collisions['left'] = True
+                    self.pos[0] = rect.x
+                else:
+                    if distance > 0:
+                        rect.bottom = tile_rect.top
+                        self.collisions['down'] = True
+                    if distance < 0:
+                        rect.top = tile_rect.bottom
+                        self.collisions['up'] = True
+                    self.pos[1] = rect.y
+
+    def sweep(self, tilemap, axis, distance):
+        # Shorten a move along one axis so the entity stops at the first solid tile in its path
+        tile_size = tilemap.tile_size
+        other = 1 - axis
+        start = int(self.pos[axis])
+        end = int(self.pos[axis] + distance)
+        # Tiles the entity spans across the move
+        low = int(self.pos[other]) // tile_size
+        high = (int(self.pos[other]) + self.size[other] - 1) // tile_size
+        if distance > 0:
+            first = (start + self.size[axis] - 1) // tile_size + 1
+            tiles = range(first, (end + self.size[axis] - 1) // tile_size + 1)
+        else:
+            first = start // tile_size - 1
+            tiles = range(first, end // tile_size - 1, -1)
+        for tile in tiles:
+            for across in range(low, high + 1):
+                if tilemap.is_solid(tile, across) if axis == 0 else tilemap.is_solid(across, tile):
+                    if distance > 0:
+                        self.collisions['right' if axis == 0 else 'down'] = True
+                        return max(0, tile * tile_size - self.size[axis] - self.pos[axis])
+                    self.collisions['left' if axis == 0 else 'up'] = True
+                    return min(0, (tile + 1) * tile_size - self.pos[axis])
+        return distance
+
+    def lerp_offset(self, offset, alpha):
+        # Render offset that draws the entity alpha of the way from its previous position to its current one
+        return (offset[0] + (self.pos[0] - self.prev_pos[0]) * (1 - alpha), offset[1] + (self.pos[1] - self.prev_pos[1]) * (1 - alpha))
 
     def render(self, surf, offset=(0, 0)):
-        surf.blit(pygame.transform.flip(self.animation.img(), self.flip, False), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
+        surf.blit(self.animation.img(self.flip), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
 
 
 class Enemy(PhysicsEntity):
     def __init__(self, game, pos, size):
         super().__init__(game, 'enemy', pos, size)
-        self.walking = 0
-        self.shoot_timer = 0  # Timer to handle shooting cooldown
 
     def update(self, tilemap, movement=(0, 0)):
-        if self.shoot_timer > 0:
-            self.shoot_timer -= 1
-        
-        if self.walking:
-            if tilemap.solid_check((self.rect().centerx + (-7 if self.flip else 7), self.pos[1] + 23)):
-                if self.collisions['right'] or self.collisions['left']:
-                    self.flip = not self.flip
-                else:
-                    movement = (movement[0] - 0.5 if self.flip else 0.5, movement[1])
-            else:
-                self.flip = not self.flip
-            self.walking = max(0, self.walking - 1)
-        
-        else:
-            dis = (self.game.player.pos[0] - self.pos[0], self.game.player.pos[1] - self.pos[1])
-            if abs(dis[1]) < 16 and self.can_see_player(self.game.player):
-                if self.shoot_timer == 0:
-                    if self.flip and dis[0] < 0:
-                        self.game.projectiles.append([[self.rect().centerx - 7, self.rect().centery], -1.5, 0])
-                        for i in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random()))
-                    elif not self.flip and dis[0] > 0:
-                        self.game.projectiles.append([[self.rect().centerx + 7, self.rect().centery], 1.5, 0])
-                        for i in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5, 2 + random.random()))
-                    self.shoot_timer = 120  # 2 seconds cooldown at 60 FPS
-            else:
-                if random.random() < 0.01:
-                    self.walking = random.randint(30, 120)
-
+        # Move and animate, the decisions of every enemy are made together by EnemyManager.think
         super().update(tilemap, movement=movement)
 
         if movement[0] != 0:
@@ -109,28 +141,20 @@ class Enemy(PhysicsEntity):
         else:
             self.set_action('idle')
 
-        if abs(self.game.player.dashing) >= 50:
-            if self.rect().collidepoint(self.game.player.rect().center):
-                for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(Spark(self.rect().center, angle, 2 + random.random()))
-                    self.game.particles.add_particle(self.rect().center, 'particle', velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7))
-                self.game.sparks.append(Spark(self.rect().center, 0, 5 + random.random()))
-                self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random()))
-                return True
-
-    def can_see_player(self, player):
-        player_rect = player.rect()
-        for x in range(self.rect().x, player_rect.x, -1 if self.flip else 1):
-            if self.game.tilemap.solid_check((x, self.pos[1])):
-                return False
-        return True
+    def dash_hit(self):
+        # Burst of sparks and particles while the dashing player passes through
+        for i in range(30):
+            angle = random.random() * math.pi * 2
+            speed = random.random() * 5
+            self.game.sparks.add_spark(self.rect().center, angle, 2 + random.random())
+            self.game.particles.add_particle(self.rect().center, 'particle', velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7))
+        self.game.sparks.add_spark(self.rect().center, 0, 5 + random.random())
+        self.game.sparks.add_spark(self.rect().center, math.pi, 5 + random.random())
 
     def render(self, surf, offset=(0, 0)):
         super().render(surf, offset=offset)
         if self.flip:
-            surf.blit(pygame.transform.flip(self.game.assets['gun'], True, False), (self.rect().centerx - 4 - self.game.assets['gun'].get_width() - offset[0], self.rect().centery - offset[1]))
+            surf.blit(self.game.assets['gun/flipped'], (self.rect().centerx - 4 - self.game.assets['gun'].get_width() - offset[0], self.rect().centery - offset[1]))
         else:
             surf.blit(self.game.assets['gun'], (self.rect().centerx + 4 - offset[0], self.rect().centery - offset[1]))
 
@@ -194,9 +218,9 @@ class Player(PhysicsEntity):
 
         # Check for collision with enemies while dashing
         if abs(self.dashing) > 50:
-            for enemy in self.game.enemies:
-                if self.rect().colliderect(enemy.rect()):
-                    self.game.enemies.remove(enemy)
+            for enemy in self.game.entity_grid.query_rect(self.rect()):
+                if enemy is not self:
+                    self.game.remove_enemy(enemy)
                     self.game.enemy_score += 20  # Add 20 to enemy score when enemy is eliminated
                     break
 
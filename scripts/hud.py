@@ -0,0 +1,31 @@
+from collections import OrderedDict
+
+# Number of rendered texts kept, least recently drawn texts (old scores) are dropped first
+TEXT_CACHE_SIZE = 32
+
+class HUD:
+    def __init__(self, font):
+        self.font = font
+        # Rendered text surfaces by (text, color), ordered from least to most recently drawn
+        self.texts = OrderedDict()
+        # Number of texts rasterised so far
+        self.rendered = 0
+
+    def text(self, text, color=(255, 255, 255)):
+        # Rendered surface of a text, rasterised only the first time it is drawn
+        key = (text, color)
+        surface = self.texts.get(key)
+        if surface is None:
+            surface = self.font.render(text, True, color)
+            self.rendered += 1
+            self.texts[key] = surface
+            if len(self.texts) > TEXT_CACHE_SIZE:
+                self.texts.popitem(last=False)
+        else:
+            self.texts.move_to_end(key)
+        return surface
+
+    def blit(self, surf, text, pos, color=(255, 255, 255), anchor='topleft'):
+        # Draw a text with one of its Rect anchor points (topleft, center, midtop...) at a position
+        surface = self.text(text, color)
+        surf.blit(surface, surface.get_rect(**{anchor: pos}))
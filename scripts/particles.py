@@ -1,44 +1,99 @@
-class Particle:
-    def __init__(self, game, p_type, pos, velocity=[0, 0], frame=0):
-        self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = list(velocity)
-        self.animation = self.game.assets['particle/' + p_type].copy()
-        self.animation.frame = frame
-
-    def update(self):
-        kill = False
-        if self.animation.done:
-            kill = True
-
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
-
-        self.animation.update()
-
-        return kill
+import numpy as np
+import pygame
 
-    def render(self, surf, offset=(0, 0)):
-        img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width() // 2, self.pos[1] - offset[1] - img.get_height() // 2))
+# Maximum number of live particles, new particles are dropped while the system is full
+PARTICLE_CAPACITY = 16384
 
 class ParticleSystem:
-    def __init__(self, game, p_type):
+    def __init__(self, game, p_type, capacity=PARTICLE_CAPACITY):
         self.game = game
         self.p_type = p_type
-        self.particles = []
+        self.capacity = capacity
+        # Live particles are the first self.count entries of every array, in spawn order
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.frame = np.zeros(capacity, dtype=np.int32)
+        self.done = np.zeros(capacity, dtype=bool)
+        self.kind = np.zeros(capacity, dtype=np.int32)
+
+        # Animation of every particle type, frames of all types are kept in one flat list as standalone RLE-encoded
+        # copies of the atlas images, thousands of small colorkey blits a frame are much cheaper from those
+        self.kinds = {}
+        self.images = []
+        self.first_image = np.zeros(0, dtype=np.int32)
+        self.img_duration = np.zeros(0, dtype=np.int32)
+        self.length = np.zeros(0, dtype=np.int32)
+        self.loop = np.zeros(0, dtype=bool)
+        self.half_size = np.zeros((0, 2))
+
+    def __len__(self):
+        return self.count
+
+    def register_kind(self, p_type):
+        animation = self.game.assets['particle/' + p_type]
+        self.kinds[p_type] = len(self.kinds)
+        self.first_image = np.append(self.first_image, len(self.images))
+        for image in animation.images:
+            frame = image.copy()
+            frame.set_colorkey(image.get_colorkey(), pygame.RLEACCEL)
+            self.images.append(frame)
+        self.img_duration = np.append(self.img_duration, animation.img_duration)
+        self.length = np.append(self.length, len(animation.images))
+        self.loop = np.append(self.loop, animation.loop)
+        self.half_size = np.concatenate([self.half_size, [(img.get_width() // 2, img.get_height() // 2) for img in animation.images]])
+        return self.kinds[p_type]
 
     def add_particle(self, pos, p_type=None, velocity=[0, 0], frame=0):
         if p_type is None:
             p_type = self.p_type
-        self.particles.append(Particle(self.game, p_type, pos, velocity=velocity, frame=frame))
+        if self.count == self.capacity:
+            return
+        kind = self.kinds.get(p_type)
+        if kind is None:
+            kind = self.register_kind(p_type)
+        i = self.count
+        self.pos[i] = pos
+        self.velocity[i] = velocity
+        self.frame[i] = frame
+        self.done[i] = False
+        self.kind[i] = kind
+        self.count += 1
 
     def update(self):
-        for particle in self.particles.copy():
-            if particle.update():
-                self.particles.remove(particle)
+        # Advance every particle at once, then drop the ones that were already finished
+        n = self.count
+        if not n:
+            return
+        kill = self.done[:n].copy()
+        self.pos[:n] += self.velocity[:n]
+
+        kind = self.kind[:n]
+        total = self.img_duration[kind] * self.length[kind]
+        loop = self.loop[kind]
+        frame = self.frame[:n] + 1
+        self.frame[:n] = np.where(loop, frame % total, np.minimum(frame, total - 1))
+        self.done[:n] |= ~loop & (self.frame[:n] >= total - 1)
+
+        if kill.any():
+            keep = np.flatnonzero(~kill)
+            self.count = len(keep)
+            for array in (self.pos, self.velocity, self.frame, self.done, self.kind):
+                array[:self.count] = array[keep]
 
     def render(self, surf, offset=(0, 0)):
-        for particle in self.particles:
-            particle.render(surf, offset=offset)
+        n = self.count
+        if not n:
+            return
+        kind = self.kind[:n]
+        image = self.first_image[kind] + self.frame[:n] // self.img_duration[kind]
+        corner = self.pos[:n] - offset - self.half_size[image]
+        # Skip the particles that are entirely off the surface
+        size = self.half_size[image] * 2
+        shown = (corner[:, 0] > -size[:, 0]) & (corner[:, 0] < surf.get_width()) & (corner[:, 1] > -size[:, 1]) & (corner[:, 1] < surf.get_height())
+        if not shown.all():
+            image = image[shown]
+            corner = corner[shown]
+        # Blit straight from iterators so no per-particle tuple or list outlives its blit, ten thousand of them alive
+        # at once would set off the garbage collector a dozen times a frame
+        surf.blits(zip(map(self.images.__getitem__, image.tolist()), zip(corner[:, 0].tolist(), corner[:, 1].tolist())), doreturn=False)
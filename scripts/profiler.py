@@ -0,0 +1,119 @@
+import csv
+import json
+import time
+from collections import deque
+import pygame
+
+# Number of frames kept in the rolling history
+HISTORY_FRAMES = 300
+# Frame time budget drawn as a line on the overlay graph
+FRAME_BUDGET = 1 / 60
+# Number of frames between redraws of the overlay
+OVERLAY_REFRESH = 10
+
+class Profiler:
+    def __init__(self, enabled=False, history=HISTORY_FRAMES):
+        self.enabled = enabled
+        # Whether the current frame is profiled, only frames started while enabled are, so toggling
+        # profiling halfway through a frame never records a partial frame
+        self.recording = False
+        # Seconds spent in every section of the current frame
+        self.sections = {}
+        # Values of the counters of the current frame
+        self.counters = {}
+        # Rolling history of finished frames, every entry is a flat record of times and counters
+        self.frames = deque(maxlen=history)
+        self.frame_index = 0
+        self.frame_start = 0
+        self.last = 0
+        self.font = None
+        self.panel = None
+        self.panel_frame = 0
+
+    def start_frame(self):
+        self.recording = self.enabled
+        if self.recording:
+            self.sections = {}
+            self.counters = {}
+            self.frame_start = self.last = time.perf_counter()
+
+    def lap(self, section):
+        # Attribute the time since the previous lap to a section
+        if self.recording:
+            now = time.perf_counter()
+            self.sections[section] = self.sections.get(section, 0) + now - self.last
+            self.last = now
+
+    def count(self, counter, value):
+        if self.recording:
+            self.counters[counter] = value
+
+    def end_frame(self):
+        if self.recording:
+            record = {'frame': self.frame_index, 'frame_ms': self.frame_time() * 1000}
+            for section, duration in self.sections.items():
+                record[section + '_ms'] = duration * 1000
+            record.update(self.counters)
+            self.frames.append(record)
+        self.frame_index += 1
+
+    def frame_time(self):
+        return self.last - self.frame_start
+
+    def summary(self, key):
+        # Mean, 95th percentile and maximum of a timing or counter over the rolling history
+        values = sorted(record.get(key, 0) for record in self.frames)
+        if not values:
+            return 0, 0, 0
+        return sum(values) / len(values), values[min(len(values) - 1, int(len(values) * 0.95))], values[-1]
+
+    def export(self, path):
+        # Write the rolling history as a JSON list of records or as CSV, picked by the file extension
+        records = list(self.frames)
+        if path.endswith('.csv'):
+            fields = []
+            for record in records:
+                fields += [field for field in record if field not in fields]
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(records)
+        else:
+            with open(path, 'w') as f:
+                json.dump(records, f, indent=1)
+
+    def render(self, surf, pos=(10, 50)):
+        # Draw the overlay, redrawing it every few frames so it barely shows up in its own numbers
+        if self.panel is None or self.frame_index - self.panel_frame >= OVERLAY_REFRESH:
+            self.panel = self.render_panel()
+            self.panel_frame = self.frame_index
+        surf.blit(self.panel, pos)
+
+    def render_panel(self):
+        # Draw the rolling frame time graph, the time per section and the counters
+        if self.font is None:
+            self.font = pygame.font.Font(None, 20)
+        lines = []
+        mean, p95, peak = self.summary('frame_ms')
+        lines.append(f"frame {mean:.2f} ms  p95 {p95:.2f}  max {peak:.2f}")
+        if self.frames:
+            last = self.frames[-1]
+            for key in last:
+                if key.endswith('_ms') and key != 'frame_ms':
+                    mean, p95, peak = self.summary(key)
+                    lines.append(f"{key[:-3]:<12} {mean:6.2f}  p95 {p95:6.2f}")
+            for key, value in last.items():
+                if not key.endswith('_ms') and key != 'frame':
+                    lines.append(f"{key:<16} {value}")
+
+        graph_height = 40
+        panel = pygame.Surface((max(HISTORY_FRAMES, 260), graph_height + len(lines) * 16 + 8))
+        panel.set_alpha(200)
+        budget_y = graph_height - int(graph_height / 2)
+        for i, record in enumerate(self.frames):
+            bar = min(graph_height, int(record['frame_ms'] / (FRAME_BUDGET * 1000) * (graph_height / 2)))
+            pygame.draw.line(panel, (255, 80, 80) if record['frame_ms'] > FRAME_BUDGET * 1000 else (80, 220, 80), (i, graph_height), (i, graph_height - bar))
+        pygame.draw.line(panel, (255, 255, 255), (0, budget_y), (panel.get_width(), budget_y))
+        for i, line in enumerate(lines):
+            panel.blit(self.font.render(line, True, (255, 255, 255)), (4, graph_height + 4 + i * 16))
+        return panel
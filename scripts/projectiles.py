@@ -0,0 +1,105 @@
+import math
+import random
+import numpy as np
+
+# Maximum number of live projectiles, new shots are dropped while the system is full
+PROJECTILE_CAPACITY = 4096
+# Number of frames a projectile flies before it disappears
+PROJECTILE_LIFETIME = 360
+
+class ProjectileSystem:
+    def __init__(self, game, capacity=PROJECTILE_CAPACITY):
+        self.game = game
+        self.capacity = capacity
+        # Live projectiles are the first self.count entries of every array, removal swaps the last one into the hole
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.direction = np.zeros(capacity)
+        self.age = np.zeros(capacity, dtype=np.int32)
+        # Spawn number of every projectile, hits are handled in spawn order so random draws happen in the same order
+        self.serial = np.zeros(capacity, dtype=np.int64)
+        self.spawned = 0
+
+    def __len__(self):
+        return self.count
+
+    def add_projectile(self, pos, direction):
+        if self.count == self.capacity:
+            return
+        i = self.count
+        self.pos[i] = pos
+        self.direction[i] = direction
+        self.age[i] = 0
+        self.serial[i] = self.spawned
+        self.spawned += 1
+        self.count += 1
+
+    def add_projectiles(self, pos, directions):
+        # Add a batch of projectiles in order, the ones that don't fit are dropped
+        k = min(len(directions), self.capacity - self.count)
+        i = self.count
+        self.pos[i:i + k] = pos[:k]
+        self.direction[i:i + k] = directions[:k]
+        self.age[i:i + k] = 0
+        self.serial[i:i + k] = np.arange(self.spawned, self.spawned + k)
+        self.spawned += k
+        self.count += k
+
+    def update(self):
+        # Move and age every projectile at once
+        n = self.count
+        self.pos[:n, 0] += self.direction[:n]
+        self.age[:n] += 1
+
+    def render(self, surf, offset=(0, 0), alpha=1):
+        # Draw the projectiles alpha of the way from their previous positions
+        n = self.count
+        if not n:
+            return
+        img = self.game.assets['projectile']
+        corner = self.pos[:n] - (img.get_width() / 2 + offset[0], img.get_height() / 2 + offset[1])
+        if alpha != 1:
+            corner[:, 0] -= self.direction[:n] * (1 - alpha)
+        # Only blit the projectiles that overlap the surface
+        visible = (corner[:, 0] > -img.get_width()) & (corner[:, 0] < surf.get_width()) & (corner[:, 1] > -img.get_height()) & (corner[:, 1] < surf.get_height())
+        surf.blits([(img, pos) for pos in corner[visible].tolist()], doreturn=False)
+
+    def collide(self):
+        # Remove the projectiles that hit a wall, expired or hit the player, then apply their effects
+        n = self.count
+        if not n:
+            return
+        pos = self.pos[:n]
+        wall = self.game.tilemap.solid_check_many(pos)
+        expired = ~wall & (self.age[:n] > PROJECTILE_LIFETIME)
+        player = self.game.player
+        if abs(player.dashing) < 50:
+            # Rect.collidepoint truncates the point towards zero
+            rect = player.rect()
+            x = np.trunc(pos[:, 0])
+            y = np.trunc(pos[:, 1])
+            hit = ~wall & ~expired & (x >= rect.left) & (x < rect.right) & (y >= rect.top) & (y < rect.bottom)
+        else:
+            hit = np.zeros(n, dtype=bool)
+
+        for i in sorted(np.flatnonzero(wall).tolist(), key=self.serial.__getitem__):
+            x, y = self.pos[i].tolist()
+            direction = self.direction[i]
+            for j in range(4):
+                self.game.sparks.add_spark((x, y), random.random() - 0.5 + (math.pi if direction > 0 else 0), 2 + random.random())
+        for i in range(np.count_nonzero(hit)):
+            self.game.damage_player()
+
+        self.remove(wall | expired | hit)
+
+    def remove(self, dead):
+        # Swap-remove every projectile flagged in a boolean mask over the live ones
+        dead = np.flatnonzero(dead)
+        if not len(dead):
+            return
+        count = self.count - len(dead)
+        holes = dead[dead < count]
+        movers = np.flatnonzero(~np.isin(np.arange(count, self.count), dead)) + count
+        for array in (self.pos, self.direction, self.age, self.serial):
+            array[holes] = array[movers]
+        self.count = count
@@ -1,25 +1,69 @@
-import math
+import numpy as np
 import pygame
 
-class Spark:
-    def __init__(self, pos, angle, speed):
-        self.pos = list(pos)
-        self.angle = angle
-        self.speed = speed
-        
+# Maximum number of live sparks, new sparks are dropped while the system is full
+SPARK_CAPACITY = 4096
+# Speed lost by every spark per frame, a spark dies once it stops
+SPARK_DRAG = 0.1
+
+class SparkSystem:
+    def __init__(self, capacity=SPARK_CAPACITY, color=(255, 255, 255)):
+        self.capacity = capacity
+        self.color = color
+        # Live sparks are the first self.count entries of every array, in spawn order
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.speed = np.zeros(capacity)
+        # Direction of every spark, cos and sin of its angle are computed once when it is added
+        self.direction = np.zeros((capacity, 2))
+
+    def __len__(self):
+        return self.count
+
+    def add_spark(self, pos, angle, speed):
+        if self.count == self.capacity:
+            return
+        i = self.count
+        self.pos[i] = pos
+        self.speed[i] = speed
+        self.direction[i] = (np.cos(angle), np.sin(angle))
+        self.count += 1
+
+    def add_sparks(self, pos, angles, speeds):
+        # Add a batch of sparks in order, the ones that don't fit are dropped
+        k = min(len(angles), self.capacity - self.count)
+        i = self.count
+        angles = np.asarray(angles[:k], dtype=np.float64)
+        self.pos[i:i + k] = pos[:k]
+        self.speed[i:i + k] = speeds[:k]
+        self.direction[i:i + k, 0] = np.cos(angles)
+        self.direction[i:i + k, 1] = np.sin(angles)
+        self.count += k
+
     def update(self):
-        self.pos[0] += math.cos(self.angle) * self.speed
-        self.pos[1] += math.sin(self.angle) * self.speed
-        
-        self.speed = max(0, self.speed - 0.1)
-        return not self.speed
-    
+        # Move and slow down every spark at once, then drop the ones that stopped
+        n = self.count
+        if not n:
+            return
+        self.pos[:n] += self.direction[:n] * self.speed[:n, None]
+        np.maximum(self.speed[:n] - SPARK_DRAG, 0, out=self.speed[:n])
+
+        dead = self.speed[:n] == 0
+        if dead.any():
+            keep = np.flatnonzero(~dead)
+            self.count = len(keep)
+            for array in (self.pos, self.speed, self.direction):
+                array[:self.count] = array[keep]
+
     def render(self, surf, offset=(0, 0)):
-        render_points = [
-            (self.pos[0] + math.cos(self.angle) * self.speed * 3 - offset[0], self.pos[1] + math.sin(self.angle) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi * 0.5) * self.speed * 0.5 - offset[0], self.pos[1] + math.sin(self.angle + math.pi * 0.5) * self.speed * 0.5 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi) * self.speed * 3 - offset[0], self.pos[1] + math.sin(self.angle + math.pi) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[0], self.pos[1] + math.sin(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[1]),
-        ]
-        
-        pygame.draw.polygon(surf, (255, 255, 255), render_points)
+        # Every spark is a diamond stretched along its direction, 3x its speed long and 0.5x wide
+        n = self.count
+        if not n:
+            return
+        center = self.pos[:n] - offset
+        length = self.direction[:n] * (self.speed[:n, None] * 3)
+        width = self.direction[:n, ::-1] * (self.speed[:n, None] * 0.5) * (-1, 1)
+        points = np.stack([center + length, center + width, center - length, center - width], axis=1)
+        color = self.color
+        for polygon in points.tolist():
+            pygame.draw.polygon(surf, color, polygon)
@@ -0,0 +1,65 @@
+class SpatialHash:
+    def __init__(self, cell_size=32):
+        self.cell_size = cell_size
+        # Objects in every occupied cell
+        self.cells = {}
+        # Rect, cell range and insertion order of every indexed object
+        self.rects = {}
+        self.cell_ranges = {}
+        self.order = {}
+        self.inserted = 0
+
+    def cell_range(self, rect):
+        return (rect.left // self.cell_size, rect.top // self.cell_size, (rect.right - 1) // self.cell_size, (rect.bottom - 1) // self.cell_size)
+
+    def update(self, obj, rect):
+        # Insert an object or move it to a new rect, only touching the cells that changed
+        self.rects[obj] = rect
+        cell_range = self.cell_range(rect)
+        old_range = self.cell_ranges.get(obj)
+        if cell_range == old_range:
+            return
+        if old_range is None:
+            self.order[obj] = self.inserted
+            self.inserted += 1
+        else:
+            self.unlink(obj, old_range)
+        self.cell_ranges[obj] = cell_range
+        for x in range(cell_range[0], cell_range[2] + 1):
+            for y in range(cell_range[1], cell_range[3] + 1):
+                self.cells.setdefault((x, y), set()).add(obj)
+
+    def remove(self, obj):
+        if obj in self.cell_ranges:
+            self.unlink(obj, self.cell_ranges.pop(obj))
+            del self.rects[obj]
+            del self.order[obj]
+
+    def unlink(self, obj, cell_range):
+        for x in range(cell_range[0], cell_range[2] + 1):
+            for y in range(cell_range[1], cell_range[3] + 1):
+                cell = self.cells[(x, y)]
+                cell.discard(obj)
+                if not cell:
+                    del self.cells[(x, y)]
+
+    def query_rect(self, rect):
+        # Objects whose rect collides with a rect, in the order they were inserted
+        found = set()
+        cell_range = self.cell_range(rect)
+        for x in range(cell_range[0], cell_range[2] + 1):
+            for y in range(cell_range[1], cell_range[3] + 1):
+                cell = self.cells.get((x, y))
+                if cell:
+                    found.update(obj for obj in cell if rect.colliderect(self.rects[obj]))
+        return sorted(found, key=self.order.__getitem__)
+
+    def query_point(self, pos):
+        # Objects whose rect contains a point, in the order they were inserted
+        cell = self.cells.get((int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)))
+        if not cell:
+            return []
+        return sorted((obj for obj in cell if self.rects[obj].collidepoint(pos)), key=self.order.__getitem__)
+
+    def __len__(self):
+        return len(self.rects)
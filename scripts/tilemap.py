@@ -1,6 +1,10 @@
+import sys
 import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pygame
 import noise
+import numpy as np
 import random
 
 # Mapping of autotile configurations to their corresponding tile index
@@ -23,116 +27,594 @@ PHYSICS_TILES = {'grass', 'stone'}
 # Types of tiles that can be autotiled
 AUTOTILE_TYPES = {'grass', 'stone'}
 
-# Size of each chunk in tiles
+# Size of each chunk in tiles (must be a power of two)
 CHUNK_SIZE = 8
+CHUNK_SHIFT = CHUNK_SIZE.bit_length() - 1
+CHUNK_MASK = CHUNK_SIZE - 1
+
+# Tile type codes stored in the chunk arrays, code 0 is empty space
+TILE_TYPES = [None, 'grass', 'stone']
+TILE_CODES = {tile_type: code for code, tile_type in enumerate(TILE_TYPES)}
+# Codes of the tiles that have physical properties
+PHYSICS_CODES = {TILE_CODES[tile_type] for tile_type in PHYSICS_TILES}
+# Whether every possible code is a physics tile, for checking many tiles at once
+PHYSICS_LOOKUP = np.isin(np.arange(256), list(PHYSICS_CODES))
+# Codes of the tiles that can be autotiled
+AUTOTILE_CODES = {TILE_CODES[tile_type] for tile_type in AUTOTILE_TYPES}
+
+# Bit of each neighbor of the same type in an autotile bitmask
+AUTOTILE_BITS = {(1, 0): 1, (-1, 0): 2, (0, 1): 4, (0, -1): 8}
+# Variant for every autotile bitmask, configurations missing from AUTOTILE_MAP use variant 1
+AUTOTILE_VARIANTS = bytes(AUTOTILE_MAP.get(tuple(sorted(offset for offset, bit in AUTOTILE_BITS.items() if mask & bit)), 1) for mask in range(16))
+# Border of a neighboring chunk facing a new chunk, the facing border of the new chunk
+# and the bit of the neighbor's border tiles that points back, by direction to the neighbor
+AUTOTILE_EDGES = {
+    (1, 0): (np.s_[:, 0], np.s_[:, -1], AUTOTILE_BITS[(-1, 0)]),
+    (-1, 0): (np.s_[:, -1], np.s_[:, 0], AUTOTILE_BITS[(1, 0)]),
+    (0, 1): (np.s_[0, :], np.s_[-1, :], AUTOTILE_BITS[(0, -1)]),
+    (0, -1): (np.s_[-1, :], np.s_[0, :], AUTOTILE_BITS[(0, 1)]),
+}
+
+# Radius in chunks generated around the player every frame
+GENERATION_RADIUS = 2
+# Radius in chunks that is always generated synchronously when a worker pool is used
+REQUIRED_RADIUS = 1
+# Number of frames ahead the worker pool predicts the player position for
+PREDICTION_FRAMES = 30
+# Maximum number of chunks queued on the worker pool at once, enough for the 40 chunks of the starting area
+# outside REQUIRED_RADIUS so none of them is dropped, the initial enemies stand on its outer ring
+MAX_PENDING_CHUNKS = 48
+# Maximum number of finished chunks installed per frame, the rest wait for the next frames
+MAX_INSTALLS_PER_FRAME = 8
+
+# Most memoised line of sight results kept, the memo is dropped once it grows past this
+SIGHT_CACHE_SIZE = 4096
+
+# Lifecycle states of a chunk in the chunk registry
+CHUNK_UNKNOWN = 0  # neither resident nor stored
+CHUNK_GENERATED = 1  # kept in the chunk store but not held in memory
+CHUNK_RESIDENT = 2  # generated and held in self.chunks
+
+# Collision backends: solidity read from the resident chunks, or computed from the terrain heights
+# with the placed tiles on top, so it doesn't depend on which chunks are resident
+COLLISION_BACKENDS = ('tiles', 'heightfield')
+
+def chunk_seed(seed, x, y):
+    # Combine the world seed and a chunk coordinate into the seed of the chunk's random generator
+    return (seed * 0x9E3779B1) ^ (x * 0x85EBCA77) ^ (y * 0xC2B2AE3D)
 
 class TileMap:
-    def __init__(self, game, tile_size=16, seed=None):
+    def __init__(self, game, tile_size=16, seed=None, stream_radius=None, max_chunks=None, workers=0, store=None, collision='tiles'):
+        if collision not in COLLISION_BACKENDS:
+            raise ValueError(f"unknown collision backend {collision!r}")
         self.game = game
         self.tile_size = tile_size
-        self.tilemap = {}
+        # Tile codes are stored per chunk in a flat bytearray indexed by (y * CHUNK_SIZE + x),
+        # ordered from least to most recently used
+        self.chunks = OrderedDict()
+        # Lifecycle state of the resident chunks, evicted chunks are forgotten so this stays bounded
+        self.chunk_states = {}
+        # Explicitly placed tiles by chunk, reapplied whenever their chunk is loaded
+        self.placed_tiles = {}
+        # The same placed tiles by world column then row, for the height field backend
+        self.placed_columns = {}
+        # Autotile neighbor bitmasks of the tiles in every resident chunk, laid out like the chunk
+        self.autotile_masks = {}
+        # Pre-rendered surfaces of resident chunks, rebuilt when a tile in the chunk changes
+        self.chunk_surfaces = {}
+        # Terrain heights by chunk column, shared by every chunk stacked in that column
+        self.height_cache = {}
+        # Row of the surface of every world column, every tile from it down is solid with the height field backend
+        self.surface_rows = {}
+        self.heightfield = collision == 'heightfield'
+        # Streaming mode: chunks further than stream_radius from the player are evicted,
+        # and least recently used chunks are evicted while more than max_chunks are resident
+        self.stream_radius = stream_radius
+        if max_chunks is not None:
+            max_chunks = max(max_chunks, (GENERATION_RADIUS * 2 + 1) ** 2)
+        self.max_chunks = max_chunks
+        self.stream_center = None
+        self.chunks_evicted = 0
+        # Background generation: chunks ahead of the player are generated on a thread pool
+        # and handed back to the main thread by collect_chunks
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+        # Futures of the queued chunks in request order
+        self.pending = {}
+        self.last_center = None
+        # Optional on-disk ChunkStore holding the generated terrain of every chunk for this seed
+        self.store = store
+        # Chunks paged in from the store and chunks generated, counted when the read or generation is started.
+        # The frame counters are reset on every generate_around_player call
+        self.chunks_read = 0
+        self.chunks_generated = 0
+        self.frame_reads = 0
+        self.frame_generations = 0
+        self.chunks_drawn = 0
+        # Memoised line of sight results, cleared whenever a resident tile changes
+        # (or with the height field backend, only when a tile is placed)
+        self.sight_cache = {}
         self.offgrid_tiles = []
         self.seed = seed if seed is not None else random.randint(0, 1000000)
 
-        # Generate initial chunks around the starting area
+        # Place the wall first so it is applied as its chunks are installed, then make the chunks around the spawn
+        # resident right away and leave the rest of the starting area to the worker pool
+        self.create_stone_wall(-4)
         for x in range(-3, 4):
             for y in range(-3, 4):
-                chunk_data = self.generate_chunk(x, y)
-                for tile in chunk_data:
-                    self.tilemap[str(tile[0][0]) + ';' + str(tile[0][1])] = {
-                        'type': tile[1],
-                        'variant': 1,
-                        'pos': tile[0]
-                    }
-        self.create_stone_wall(-4)
+                if self.executor is None or max(abs(x), abs(y)) <= REQUIRED_RADIUS:
+                    self.load_chunk(x, y)
+                else:
+                    self.request_chunk(x, y)
 
-    def generate_chunk(self, x, y):
-        chunk_data = []
-        for y_pos in range(CHUNK_SIZE):
-            for x_pos in range(CHUNK_SIZE):
-                target_x = x * CHUNK_SIZE + x_pos
-                target_y = y * CHUNK_SIZE + y_pos
-                tile_type = 'empty'
+    def close(self):
+        # Stop the worker pool and close the store, the tilemap is not used afterwards
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.store is not None:
+            self.store.close()
+
+    def chunk_state(self, x, y):
+        state = self.chunk_states.get((x, y))
+        if state is not None:
+            return state
+        return CHUNK_GENERATED if self.store is not None and (x, y) in self.store else CHUNK_UNKNOWN
+
+    def load_chunk(self, x, y):
+        # Make a chunk resident, reusing a result from the worker pool or the store if there is one
+        chunk_loc = (x, y)
+        future = self.pending.pop(chunk_loc, None)
+        if future is not None and not future.cancel():
+            # Already running or finished on a worker
+            self.install_chunk(chunk_loc, self.store_chunk(chunk_loc, future.result()))
+            return
+        chunk = self.store.get(x, y) if self.store is not None else None
+        if chunk is not None:
+            self.count_read()
+        else:
+            chunk = self.store_chunk(chunk_loc, self.generate_chunk(x, y))
+            # A cancelled generation on the pool was already counted when it was queued
+            if future is None:
+                self.count_generation()
+        self.install_chunk(chunk_loc, chunk)
+
+    def count_read(self):
+        self.chunks_read += 1
+        self.frame_reads += 1
+
+    def count_generation(self):
+        self.chunks_generated += 1
+        self.frame_generations += 1
+
+    def store_chunk(self, chunk_loc, chunk):
+        # Save freshly generated terrain to the store before tiles are placed on top of it
+        if self.store is not None:
+            self.store.put(chunk_loc[0], chunk_loc[1], chunk)
+        return chunk
+
+    def request_chunk(self, x, y):
+        # Queue a chunk for generation on the worker pool, it is placeholder air until it lands
+        chunk_loc = (x, y)
+        if chunk_loc in self.pending or self.chunk_states.get(chunk_loc) == CHUNK_RESIDENT:
+            return
+        if self.store is not None and chunk_loc in self.store:
+            # Paging a stored chunk in is cheaper than a round trip through the pool
+            self.load_chunk(x, y)
+        elif len(self.pending) < MAX_PENDING_CHUNKS:
+            self.pending[chunk_loc] = self.executor.submit(self.generate_chunk, x, y)
+            self.count_generation()
+
+    def collect_chunks(self):
+        # Install the chunks the worker pool has finished without waiting on the others, a few per frame.
+        # When they land depends on the worker timing, seeded runs that must replay exactly use workers=0
+        installed = 0
+        for chunk_loc, future in list(self.pending.items()):
+            if installed == MAX_INSTALLS_PER_FRAME:
+                break
+            if future.done():
+                del self.pending[chunk_loc]
+                self.install_chunk(chunk_loc, self.store_chunk(chunk_loc, future.result()))
+                installed += 1
+
+    def install_chunk(self, chunk_loc, chunk):
+        # Make generated chunk data resident, with the tiles placed in it on top
+        for index, code in self.placed_tiles.get(chunk_loc, {}).items():
+            chunk[index] = code
+        self.chunks[chunk_loc] = chunk
+        self.chunk_surfaces.pop(chunk_loc, None)
+        if not self.heightfield:
+            self.sight_cache.clear()
+        self.autotile_chunk(chunk_loc)
+        self.chunk_states[chunk_loc] = CHUNK_RESIDENT
+
+    def evict_chunk(self, chunk_loc):
+        # Drop a resident chunk, it is regenerated if the player comes back
+        del self.chunks[chunk_loc]
+        del self.autotile_masks[chunk_loc]
+        self.chunk_surfaces.pop(chunk_loc, None)
+        if not self.heightfield:
+            self.sight_cache.clear()
+        del self.chunk_states[chunk_loc]
+        self.chunks_evicted += 1
+
+    def stream_chunks(self, center_chunk):
+        # Evict chunks outside the streaming radius, then the least recently used chunks over budget
+        if self.stream_radius is not None and center_chunk != self.stream_center:
+            self.stream_center = center_chunk
+            for chunk_loc in list(self.chunks):
+                if max(abs(chunk_loc[0] - center_chunk[0]), abs(chunk_loc[1] - center_chunk[1])) > self.stream_radius:
+                    self.evict_chunk(chunk_loc)
+            for x in list(self.height_cache):
+                if abs(x - center_chunk[0]) > self.stream_radius:
+                    del self.height_cache[x]
+            for x in list(self.surface_rows):
+                if abs((x >> CHUNK_SHIFT) - center_chunk[0]) > self.stream_radius:
+                    del self.surface_rows[x]
+            # Line of sight keys are (tile row, first tile column, last tile column)
+            for key in list(self.sight_cache):
+                if abs((key[0] >> CHUNK_SHIFT) - center_chunk[1]) > self.stream_radius or abs((key[1] >> CHUNK_SHIFT) - center_chunk[0]) > self.stream_radius or abs((key[2] >> CHUNK_SHIFT) - center_chunk[0]) > self.stream_radius:
+                    del self.sight_cache[key]
+        if len(self.sight_cache) > SIGHT_CACHE_SIZE:
+            self.sight_cache.clear()
+        if self.max_chunks is not None:
+            while len(self.chunks) > self.max_chunks:
+                self.evict_chunk(next(iter(self.chunks)))
+
+    def stream_stats(self):
+        # Resident chunk count and an estimate of the bytes held by the tilemap: tile codes, autotile masks,
+        # baked chunk surfaces (by far the largest), placed tiles and the per-column and line of sight caches
+        stored = sum(1 for chunk_loc in self.store.index if chunk_loc not in self.chunk_states) if self.store is not None else 0
+        size = 0
+        for table in (self.chunks, self.chunk_states, self.autotile_masks, self.chunk_surfaces, self.placed_tiles,
+                      self.placed_columns, self.height_cache, self.surface_rows, self.sight_cache):
+            size += sys.getsizeof(table)
+        for chunk_loc, chunk in self.chunks.items():
+            size += sys.getsizeof(chunk_loc) + sys.getsizeof(chunk)
+        for masks in self.autotile_masks.values():
+            size += sys.getsizeof(masks)
+        for chunk_surf in self.chunk_surfaces.values():
+            if chunk_surf is not None:
+                size += chunk_surf.get_height() * chunk_surf.get_pitch()
+        for tiles in self.placed_tiles.values():
+            size += sys.getsizeof(tiles)
+        for rows in self.placed_columns.values():
+            size += sys.getsizeof(rows)
+        # Worker threads add columns to the height cache while they generate, so walk a snapshot of it
+        for heights in list(self.height_cache.values()):
+            size += heights.nbytes
+        return {'resident_chunks': len(self.chunks), 'known_chunks': len(self.chunk_states) + stored, 'bytes': size}
+
+    def get_code(self, x, y):
+        # Get the tile code at a tile coordinate, 0 if there is no tile
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return 0
+        return chunk[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    def set_tile(self, x, y, tile_type):
+        # Place a tile at a tile coordinate, it is kept across chunk eviction
+        chunk_loc = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        code = TILE_CODES[tile_type]
+        self.placed_tiles.setdefault(chunk_loc, {})[index] = code
+        self.placed_columns.setdefault(x, {})[y] = code
+        chunk = self.chunks.get(chunk_loc)
+        if chunk is not None or self.heightfield:
+            self.sight_cache.clear()
+        if chunk is not None:
+            chunk[index] = code
+            self.autotile_around(x, y)
+
+    def autotile_chunk(self, chunk_loc):
+        # Compute the autotile bitmasks of a new chunk and update the borders of the loaded chunks next to it
+        codes = np.frombuffer(self.chunks[chunk_loc], dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE)
+        grid = np.zeros((CHUNK_SIZE + 2, CHUNK_SIZE + 2), dtype=np.uint8)
+        grid[1:-1, 1:-1] = codes
+        for direction, (neighbor_edge, edge, bit) in AUTOTILE_EDGES.items():
+            neighbor_loc = (chunk_loc[0] + direction[0], chunk_loc[1] + direction[1])
+            neighbor = self.chunks.get(neighbor_loc)
+            if neighbor is None:
+                continue
+            neighbor_codes = np.frombuffer(neighbor, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE)
+            # Copy the neighbor's facing border into the padding around the new chunk
+            grid[1 + direction[1]:CHUNK_SIZE + 1 + direction[1], 1 + direction[0]:CHUNK_SIZE + 1 + direction[0]][edge] = neighbor_codes[neighbor_edge]
+            # Set or clear the bits of the neighbor's border tiles that point into the new chunk
+            neighbor_masks = np.frombuffer(self.autotile_masks[neighbor_loc], dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE)
+            same = (neighbor_codes[neighbor_edge] == codes[edge]) & (codes[edge] != 0)
+            neighbor_masks[neighbor_edge] = np.where(same, neighbor_masks[neighbor_edge] | bit, neighbor_masks[neighbor_edge] & (0xF ^ bit))
+            self.chunk_surfaces.pop(neighbor_loc, None)
+        masks = np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=np.uint8)
+        for offset, bit in AUTOTILE_BITS.items():
+            masks |= (grid[1 + offset[1]:CHUNK_SIZE + 1 + offset[1], 1 + offset[0]:CHUNK_SIZE + 1 + offset[0]] == codes) * np.uint8(bit)
+        masks[codes == 0] = 0
+        self.autotile_masks[chunk_loc] = bytearray(masks.tobytes())
+
+    def autotile_around(self, x, y):
+        # Recompute the autotile bitmasks of a changed tile and its four neighbors
+        for tile_x, tile_y in ((x, y), (x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            chunk_loc = (tile_x >> CHUNK_SHIFT, tile_y >> CHUNK_SHIFT)
+            masks = self.autotile_masks.get(chunk_loc)
+            if masks is None:
+                continue
+            code = self.get_code(tile_x, tile_y)
+            mask = 0
+            if code:
+                for offset, bit in AUTOTILE_BITS.items():
+                    if self.get_code(tile_x + offset[0], tile_y + offset[1]) == code:
+                        mask |= bit
+            masks[((tile_y & CHUNK_MASK) << CHUNK_SHIFT) | (tile_x & CHUNK_MASK)] = mask
+            self.chunk_surfaces.pop(chunk_loc, None)
+
+    def get_variant(self, x, y):
+        # Get the autotiled variant of the tile at a tile coordinate
+        chunk_loc = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if chunk_loc not in self.chunks or self.chunks[chunk_loc][index] not in AUTOTILE_CODES:
+            return 1
+        return AUTOTILE_VARIANTS[self.autotile_masks[chunk_loc][index]]
+
+    def tile_at(self, x, y):
+        # Compatibility accessor returning the tile at a tile coordinate as a dict
+        code = self.get_code(x, y)
+        if code:
+            return {'type': TILE_TYPES[code], 'variant': self.get_variant(x, y), 'pos': (x, y)}
+
+    def column_heights(self, x):
+        # Get the terrain heights of the world columns in chunk column x, computed once and cached
+        heights = self.height_cache.get(x)
+        if heights is None:
+            heights = []
+            for target_x in range(x * CHUNK_SIZE, (x + 1) * CHUNK_SIZE):
                 # Generate height using Perlin noise
                 base_height = noise.pnoise1(target_x * 0.1, octaves=4, base=self.seed)
                 detail_height = noise.pnoise1(target_x * 0.05, octaves=2, base=self.seed + 1)
                 secondary_height = noise.pnoise1(target_x * 0.02, octaves=6, base=self.seed + 2)
-                height = int((base_height + 0.5 * detail_height + 0.3 * secondary_height) * 15)
-                if target_y > 8 - height:
-                    tile_type = 'stone'
-                elif target_y == 8 - height:
-                    tile_type = 'grass'
-                if height > 4 and target_y == 8 - height + 1 and random.random() > 0.7:
-                    tile_type = 'grass'
-                if tile_type != 'empty':
-                    chunk_data.append([[target_x, target_y], tile_type])
-        return chunk_data
+                heights.append(int((base_height + 0.5 * detail_height + 0.3 * secondary_height) * 15))
+            heights = self.height_cache[x] = np.array(heights)
+        return heights
+
+    def surface_row(self, x):
+        # Get the row of the terrain surface in world column x, computed with the rest of its chunk column and cached
+        row = self.surface_rows.get(x)
+        if row is None:
+            chunk_x = x >> CHUNK_SHIFT
+            for i, surface in enumerate((8 - self.column_heights(chunk_x)).tolist()):
+                self.surface_rows[chunk_x * CHUNK_SIZE + i] = surface
+            row = self.surface_rows[x]
+        return row
+
+    def generate_chunk(self, x, y):
+        # Generate the tile codes of a chunk as a flat bytearray in one pass over its columns
+        heights = self.column_heights(x)
+        surface = 8 - heights
+        rows = np.arange(y * CHUNK_SIZE, (y + 1) * CHUNK_SIZE)[:, None]
+        if rows[-1, 0] < surface.min():
+            return bytearray(CHUNK_SIZE * CHUNK_SIZE)
+        codes = np.where(rows > surface, TILE_CODES['stone'], np.where(rows == surface, TILE_CODES['grass'], 0)).astype(np.uint8)
+        # Randomly turn the stone under tall grass into grass, seeded per chunk so it can be reproduced
+        decoration = np.nonzero((rows == surface + 1) & (heights > 4))
+        rng = random.Random(chunk_seed(self.seed, x, y)) if len(decoration[0]) else None
+        for y_pos, x_pos in zip(*decoration):
+            if rng.random() > 0.7:
+                codes[y_pos, x_pos] = TILE_CODES['grass']
+        return bytearray(codes.tobytes())
 
     def create_stone_wall(self, x_position):
         # Create a vertical stone wall at the specified x position
         for y in range(-CHUNK_SIZE * 10, CHUNK_SIZE * 10):
             for x in range(x_position, x_position + 1):
-                self.tilemap[str(x) + ';' + str(y)] = {
-                    'type': 'stone',
-                    'variant': 1,
-                    'pos': (x, y)
-                }
+                self.set_tile(x, y, 'stone')
 
     def generate_around_player(self, player_pos):
         # Determine the chunk the player is currently in
         player_chunk_x = player_pos[0] // (self.tile_size * CHUNK_SIZE)
         player_chunk_y = player_pos[1] // (self.tile_size * CHUNK_SIZE)
         chunks_to_generate = []
+        self.frame_reads = 0
+        self.frame_generations = 0
 
-        # Identify chunks around the player that need to be generated
-        for x in range(player_chunk_x - 2, player_chunk_x + 3):
-            for y in range(player_chunk_y - 2, player_chunk_y + 3):
-                loc = str(x * CHUNK_SIZE) + ';' + str(y * CHUNK_SIZE)
-                if loc not in self.tilemap:
+        # Identify chunks around the player that need to be generated, marking the rest as recently used
+        for x in range(player_chunk_x - GENERATION_RADIUS, player_chunk_x + GENERATION_RADIUS + 1):
+            for y in range(player_chunk_y - GENERATION_RADIUS, player_chunk_y + GENERATION_RADIUS + 1):
+                if self.chunk_states.get((x, y)) != CHUNK_RESIDENT:
                     chunks_to_generate.append((x, y))
+                else:
+                    self.chunks.move_to_end((x, y))
 
-        # Generate the identified chunks
-        for chunk in chunks_to_generate:
-            chunk_data = self.generate_chunk(chunk[0], chunk[1])
-            for tile in chunk_data:
-                self.tilemap[str(tile[0][0]) + ';' + str(tile[0][1])] = {
-                    'type': tile[1],
-                    'variant': 1,
-                    'pos': tile[0]
-                }
+        if self.executor is None:
+            # Generate the identified chunks
+            for chunk in chunks_to_generate:
+                self.load_chunk(chunk[0], chunk[1])
+        else:
+            self.collect_chunks()
+            # Only the chunks right around the player are needed this frame, the rest are queued
+            for chunk in chunks_to_generate:
+                if max(abs(chunk[0] - player_chunk_x), abs(chunk[1] - player_chunk_y)) <= REQUIRED_RADIUS:
+                    self.load_chunk(chunk[0], chunk[1])
+                else:
+                    self.request_chunk(chunk[0], chunk[1])
+            # Queue the chunks around where the player is heading
+            if self.last_center is not None:
+                predicted_x = player_pos[0] + (player_pos[0] - self.last_center[0]) * PREDICTION_FRAMES
+                predicted_y = player_pos[1] + (player_pos[1] - self.last_center[1]) * PREDICTION_FRAMES
+                predicted_chunk_x = int(predicted_x // (self.tile_size * CHUNK_SIZE))
+                predicted_chunk_y = int(predicted_y // (self.tile_size * CHUNK_SIZE))
+                if (predicted_chunk_x, predicted_chunk_y) != (player_chunk_x, player_chunk_y):
+                    for x in range(predicted_chunk_x - GENERATION_RADIUS, predicted_chunk_x + GENERATION_RADIUS + 1):
+                        for y in range(predicted_chunk_y - GENERATION_RADIUS, predicted_chunk_y + GENERATION_RADIUS + 1):
+                            self.request_chunk(x, y)
+        self.last_center = player_pos
+
+        self.stream_chunks((player_chunk_x, player_chunk_y))
 
     def tiles_around(self, pos):
         # Get tiles around a given position
         tiles = []
         tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
-            if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
+            tile = self.tile_at(tile_loc[0] + offset[0], tile_loc[1] + offset[1])
+            if tile:
+                tiles.append(tile)
         return tiles
 
     def solid_check(self, pos):
         # Check if a tile at a given position is solid
-        tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size))
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
+        x = int(pos[0] // self.tile_size)
+        y = int(pos[1] // self.tile_size)
+        if self.heightfield:
+            return self.height_solid(x, y)
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        return chunk is not None and chunk[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)] in PHYSICS_CODES
+
+    def is_solid(self, x, y):
+        # Check if the tile at a tile coordinate is solid
+        if self.heightfield:
+            return self.height_solid(x, y)
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        return chunk is not None and chunk[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)] in PHYSICS_CODES
+
+    def height_solid(self, x, y):
+        # Check if the tile at a tile coordinate is solid from the terrain heights, placed tiles take precedence
+        placed = self.placed_columns.get(x)
+        if placed is not None and y in placed:
+            return placed[y] in PHYSICS_CODES
+        row = self.surface_rows.get(x)
+        if row is None:
+            row = self.surface_row(x)
+        return y >= row
+
+    def rect_solid(self, rect):
+        # Check if any tile overlapping a rect in pixels is solid
+        tile_size = self.tile_size
+        top = rect.top // tile_size
+        bottom = (rect.bottom - 1) // tile_size
+        for x in range(rect.left // tile_size, (rect.right - 1) // tile_size + 1):
+            if self.heightfield and x not in self.placed_columns:
+                # The column is solid from its surface down, so only its bottom tile needs checking
+                row = self.surface_rows.get(x)
+                if row is None:
+                    row = self.surface_row(x)
+                if bottom >= row:
+                    return True
+                continue
+            for y in range(top, bottom + 1):
+                if self.is_solid(x, y):
+                    return True
+        return False
+
+    def solid_check_many(self, points):
+        # Check solidity at every row of an (n, 2) array of positions, looking each chunk up once
+        tiles = (points // self.tile_size).astype(np.int64)
+        if self.heightfield:
+            # Compare with the surface rows of the touched world columns, then let the placed tiles override them
+            columns, inverse = np.unique(tiles[:, 0], return_inverse=True)
+            rows = np.array([self.surface_row(x) for x in columns.tolist()], dtype=np.int64)
+            solid = tiles[:, 1] >= rows[inverse.ravel()]
+            if self.placed_columns:
+                for i in np.flatnonzero(np.isin(tiles[:, 0], list(self.placed_columns))).tolist():
+                    solid[i] = self.height_solid(int(tiles[i, 0]), int(tiles[i, 1]))
+            return solid
+        chunk_x = tiles[:, 0] >> CHUNK_SHIFT
+        chunk_y = tiles[:, 1] >> CHUNK_SHIFT
+        index = ((tiles[:, 1] & CHUNK_MASK) << CHUNK_SHIFT) | (tiles[:, 0] & CHUNK_MASK)
+        keys, first, inverse = np.unique((chunk_x << 32) + chunk_y, return_index=True, return_inverse=True)
+        # Gather the codes from the touched chunks laid end to end, missing chunks read as empty space
+        empty = bytes(CHUNK_SIZE * CHUNK_SIZE)
+        codes = np.frombuffer(b''.join(self.chunks.get(chunk_loc, empty) for chunk_loc in zip(chunk_x[first].tolist(), chunk_y[first].tolist())), dtype=np.uint8)
+        return PHYSICS_LOOKUP[codes[inverse.ravel() * (CHUNK_SIZE * CHUNK_SIZE) + index]]
+
+    def raycast(self, start, end):
+        # Walk the tiles crossed by the segment from start to end, both in pixels, one tile at a time (grid DDA).
+        # Returns the tile coordinate of the first physics tile on the way, or None if the segment is clear
+        tile_size = self.tile_size
+        chunks = self.chunks
+        heightfield = self.heightfield
+        x = int(start[0] // tile_size)
+        y = int(start[1] // tile_size)
+        end_x = int(end[0] // tile_size)
+        end_y = int(end[1] // tile_size)
+        dx = end[0] - start[0]
+        dy = end[1] - start[1]
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        if heightfield and y == end_y:
+            # A segment within one row, like an enemy's line of sight, crosses its tiles in order
+            for x in range(x, end_x + step_x, step_x):
+                if self.height_solid(x, y):
+                    return (x, y)
+            return None
+        # Fraction of the segment until the next vertical and horizontal tile edge, and between two edges
+        if dx:
+            next_x = ((x + (step_x > 0)) * tile_size - start[0]) / dx
+            delta_x = tile_size / abs(dx)
+        else:
+            next_x = delta_x = float('inf')
+        if dy:
+            next_y = ((y + (step_y > 0)) * tile_size - start[1]) / dy
+            delta_y = tile_size / abs(dy)
+        else:
+            next_y = delta_y = float('inf')
+
+        for i in range(abs(end_x - x) + abs(end_y - y) + 1):
+            if heightfield:
+                if self.height_solid(x, y):
+                    return (x, y)
+            else:
+                chunk = chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+                if chunk is not None and chunk[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)] in PHYSICS_CODES:
+                    return (x, y)
+            if next_x < next_y:
+                next_x += delta_x
+                x += step_x
+            else:
+                next_y += delta_y
+                y += step_y
+        return None
 
     def physics_rects_around(self, pos):
         # Get the physical rectangles of tiles around a given position
         rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size, self.tile_size))
+        tile_x = int(pos[0] // self.tile_size)
+        tile_y = int(pos[1] // self.tile_size)
+        for offset in NEIGHBOR_OFFSETS:
+            x = tile_x + offset[0]
+            y = tile_y + offset[1]
+            if self.is_solid(x, y):
+                rects.append(pygame.Rect(x * self.tile_size, y * self.tile_size, self.tile_size, self.tile_size))
         return rects
 
-    def render(self, surf, offset=(0, 0)):
-        # Generate tiles around the player before rendering
-        self.generate_around_player((offset[0] + surf.get_width() // 2, offset[1] + surf.get_height() // 2))
+    def render(self, surf, offset=(0, 0), generate=True):
+        # Generate tiles around the player before rendering, unless the caller already did
+        if generate:
+            self.generate_around_player((offset[0] + surf.get_width() // 2, offset[1] + surf.get_height() // 2))
+        self.chunks_drawn = 0
         # Render offgrid tiles
         for tile in self.offgrid_tiles:
             surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
-        # Render tiles in the tilemap
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
+        # Render the baked surfaces of the chunks inside the camera rectangle
+        chunk_px = self.tile_size * CHUNK_SIZE
+        for x in range(offset[0] // chunk_px, (offset[0] + surf.get_width()) // chunk_px + 1):
+            for y in range(offset[1] // chunk_px, (offset[1] + surf.get_height()) // chunk_px + 1):
+                chunk_loc = (x, y)
+                if chunk_loc in self.chunk_surfaces:
+                    chunk_surf = self.chunk_surfaces[chunk_loc]
+                else:
+                    if chunk_loc not in self.chunks:
+                        continue
+                    chunk_surf = self.chunk_surfaces[chunk_loc] = self.bake_chunk(chunk_loc)
+                if chunk_surf is not None:
+                    surf.blit(chunk_surf, (x * chunk_px - offset[0], y * chunk_px - offset[1]))
+                    self.chunks_drawn += 1
+
+    def bake_chunk(self, chunk_loc):
+        # Rasterise the tiles of a chunk into one surface, None if the chunk is empty
+        chunk = self.chunks[chunk_loc]
+        if chunk.count(0) == len(chunk):
+            return None
+        masks = self.autotile_masks[chunk_loc]
+        chunk_surf = pygame.Surface((self.tile_size * CHUNK_SIZE, self.tile_size * CHUNK_SIZE))
+        chunk_surf.set_colorkey((0, 0, 0))
+        for index, code in enumerate(chunk):
+            if code:
+                variant = AUTOTILE_VARIANTS[masks[index]] if code in AUTOTILE_CODES else 1
+                chunk_surf.blit(self.game.assets[TILE_TYPES[code]][variant], ((index & CHUNK_MASK) * self.tile_size, (index >> CHUNK_SHIFT) * self.tile_size))
+        return chunk_surf
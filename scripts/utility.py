@@ -1,29 +1,25 @@
-import os
 import pygame
-
-BASE_IMAGE_PATH = "GameTut/data/images/"
+from scripts.assets import ASSETS, BASE_IMAGE_PATH, BASE_CACHE_PATH
 
 def LoadImage(path):
-    image = pygame.image.load(BASE_IMAGE_PATH + path).convert()
-    image.set_colorkey((0, 0, 0))
-    return image
+    # Images are loaded once and shared, see scripts/assets.py
+    return ASSETS.image(path)
 
 def LoadImages(path):
-    images = []
-    for imageName in sorted(os.listdir(BASE_IMAGE_PATH + path)):
-        images.append(LoadImage(path + '/' + imageName))
-    return images
+    return ASSETS.images(path)
 
 class Animations:
-    def __init__(self, images, img_dur = 5, loop = True):
+    def __init__(self, images, img_dur = 5, loop = True, flipped = None):
         self.images = images
+        # Horizontally mirrored frames, built once and shared by every copy
+        self.flipped = flipped if flipped is not None else [pygame.transform.flip(image, True, False) for image in images]
         self.img_duration = img_dur
         self.loop = loop
         self.done = False
         self.frame = 0
 
     def copy(self):
-        return Animations(self.images, self.img_duration, self.loop)
+        return Animations(self.images, self.img_duration, self.loop, self.flipped)
     
     def update(self):
         if self.loop:
@@ -33,6 +29,6 @@ class Animations:
             if self.frame >= self.img_duration * len(self.images) - 1:
                 self.done = True
 
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)]
+    def img(self, flip=False):
+        return (self.flipped if flip else self.images)[int(self.frame / self.img_duration)]
     